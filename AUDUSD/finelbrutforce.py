@@ -7,104 +7,948 @@ Final Bruteforce strategy tester for MT5 JSON candlestick files.
 - Saves best strategy with 'symbol' for live trader
 """
 
-import json, sys, time, math, os
+import json, sys, time, os, io, hashlib, argparse, math, itertools, functools, operator, heapq, contextlib, collections, inspect
+import multiprocessing as mp
+from multiprocessing import shared_memory
 from datetime import datetime
 import pandas as pd
 import numpy as np
 
+try:
+    import numba  # optional: compiles the trade-simulation kernel
+except ImportError:
+    numba = None
+
+# -----------------------------
+# Indicator cache
+# -----------------------------
+# indicator rows are cached per dataset (keyed on the close prices) so the
+# grid computes every EMA span / RSI period once instead of once per combo
+_INDICATOR_CACHE = {}
+_INDICATOR_CACHE_SIZE = 16
+
+def dataset_key(close):
+    close = np.ascontiguousarray(close, dtype=float)
+    return len(close), hashlib.blake2b(close.tobytes(), digest_size=16).hexdigest()
+
+def indicator_cache(close, kind):
+    key = dataset_key(close)
+    entry = _INDICATOR_CACHE.get(key)
+    if entry is None:
+        while len(_INDICATOR_CACHE) >= _INDICATOR_CACHE_SIZE:
+            _INDICATOR_CACHE.pop(next(iter(_INDICATOR_CACHE)))
+        entry = _INDICATOR_CACHE[key] = {}
+    return entry.setdefault(kind, {})
+
+# optional on-disk layer (--cache DIR): artifacts are content-addressed by
+# a hash of the data they were computed from plus their parameters, so an
+# unchanged candle file hits the cache and a changed one never can. Files
+# are written atomically; the oldest are evicted once the directory grows
+# past max_bytes. CACHE_VERSION, a hash of this file (source or .pyc), is
+# part of every key, so a new version of the code never reads results an
+# older one stored.
+_DISK_CACHE = {"dir": None, "max_bytes": 256 << 20}
+
+def _code_version():
+    try:
+        with open(__file__, "rb") as f:
+            return hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+    except OSError:
+        return None
+
+CACHE_VERSION = _code_version()
+
+def set_disk_cache(path, max_mb=256):
+    _DISK_CACHE.update(dir=path, max_bytes=int(max_mb * (1 << 20)))
+    if path:
+        os.makedirs(path, exist_ok=True)
+
+def _disk_file(kind, key, ext):
+    digest = hashlib.blake2b(json.dumps([CACHE_VERSION, kind, key], default=str).encode(),
+                             digest_size=20).hexdigest()
+    return os.path.join(_DISK_CACHE["dir"], f"{kind}-{digest}.{ext}")
+
+def disk_load(kind, key):
+    # dict of arrays (npz) or a JSON payload; None when absent or disabled
+    if not _DISK_CACHE["dir"]:
+        return None
+    for ext in ("npz", "json"):
+        path = _disk_file(kind, key, ext)
+        if not os.path.exists(path):
+            continue
+        try:
+            if ext == "npz":
+                with np.load(path, allow_pickle=False) as payload:
+                    value = {name: payload[name] for name in payload.files}
+            else:
+                with open(path, "r") as f:
+                    value = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Dropping unreadable cache file {path}: {e}")
+            os.remove(path)
+            return None
+        os.utime(path)  # recently used files are evicted last
+        return value
+    return None
+
+def disk_save(kind, key, value):
+    if not _DISK_CACHE["dir"]:
+        return
+    if isinstance(value, dict) and value and all(isinstance(v, np.ndarray) for v in value.values()):
+        path = _disk_file(kind, key, "npz")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **value)
+        os.replace(tmp, path)
+    else:
+        write_json_atomic(_disk_file(kind, key, "json"), value)
+    evict_disk_cache()
+
+def evict_disk_cache():
+    root = _DISK_CACHE["dir"]
+    entries = []
+    for name in os.listdir(root):
+        try:
+            st = os.stat(os.path.join(root, name))
+        except OSError:
+            continue  # removed by another process
+        entries.append((st.st_mtime, st.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= _DISK_CACHE["max_bytes"]:
+            break
+        try:
+            os.remove(os.path.join(root, name))
+        except OSError:
+            pass
+        total -= size
+
+def _disk_rows(close, kind, cache, wanted):
+    # fill cache with this dataset's stored rows; returns the keys still missing
+    stored = disk_load(kind, dataset_key(close)) if _DISK_CACHE["dir"] else None
+    for name, row in (stored or {}).items():
+        cache.setdefault(int(name), row)
+    return [k for k in wanted if k not in cache]
+
+def _disk_store_rows(close, kind, cache):
+    disk_save(kind, dataset_key(close), {str(k): row for k, row in cache.items()})
+
+# -----------------------------
+# EMA calculation
+# -----------------------------
+def _ema_pass(close, spans, init=None):
+    # one recursive pass over the bars, vectorized across spans; mirrors the
+    # pandas ewm(span=..., adjust=False) update step so rows are bit-identical.
+    # init continues from a previous pass's last values instead of close[0].
+    spans = np.asarray(spans, dtype=float)
+    alpha = 1.0 / (1.0 + (spans - 1) / 2.0)
+    factor = 1.0 - alpha
+    denom = factor + alpha
+    n = len(close)
+    out = np.empty((len(spans), n))
+    if n == 0:
+        return out
+    if init is None:
+        weighted = np.full(len(spans), close[0])
+        out[:, 0] = weighted
+        first = 1
+    else:
+        weighted = np.asarray(init, dtype=float)
+        first = 0
+    for t in range(first, n):
+        cur = close[t]
+        if cur == cur:
+            weighted = np.where(weighted != cur, (factor * weighted + alpha * cur) / denom, weighted)
+        out[:, t] = weighted
+    return out
+
+def _batched_ema_pays(n, n_spans):
+    # the batched pass costs one Python step per bar (~4.5us), pandas a fixed
+    # ~90us plus a C loop per span; many spans on short windows favour batching
+    return n_spans * (n + 5000) >= 250 * n
+
+def ema_matrix(close, spans):
+    close = np.asarray(close, dtype=float)
+    cache = indicator_cache(close, "ema")
+    missing = sorted({int(s) for s in spans} - set(cache))
+    if missing and _DISK_CACHE["dir"]:
+        missing = _disk_rows(close, "ema", cache, missing)
+    if missing:
+        if _batched_ema_pays(len(close), len(missing)) and not np.isnan(close).any():
+            rows = _ema_pass(close, missing)
+        else:
+            # gaps follow pandas' missing-value weighting, which differs between versions
+            rows = [pd.Series(close).ewm(span=s, adjust=False).mean().to_numpy() for s in missing]
+        for span, row in zip(missing, rows):
+            cache[span] = row
+        _disk_store_rows(close, "ema", cache)
+    if len(spans) == 0:
+        return np.empty((0, len(close)))
+    return np.stack([cache[int(s)] for s in spans])
+
 # -----------------------------
 # RSI calculation
 # -----------------------------
+# gains/losses are computed once and every period's rolling mean comes from
+# the same prefix sums; the sums restart every RSI_BLOCK bars so rounding does
+# not build up over long histories and a window's sum depends only on its bars
+RSI_BLOCK = 1024
+
+def _rolling_sums(values, periods, block):
+    n = len(values)
+    pad = (-n) % block
+    local = np.concatenate([values, np.zeros(pad)]).reshape(-1, block).cumsum(axis=1).ravel()[:n]
+    out = np.full((len(periods), n), np.nan)
+    for row, p in enumerate(periods):
+        if p > n:
+            continue
+        hi = np.arange(p - 1, n)
+        offset = hi % block
+        # prefix up to the bar before the window (lo = -1 means nothing to subtract)
+        before = np.concatenate([[0.0], local[:n - p]])
+        sums = local[p - 1:] - np.where(offset >= p, before, 0.0)
+        # windows straddling a block start add the tail of the previous block
+        split = np.nonzero(offset < p - 1)[0]
+        sums[split] += local[hi[split] - offset[split] - 1] - before[split]
+        out[row, p - 1:] = sums
+    return out
+
+def _rolling_means(values, periods, block):
+    sums = _rolling_sums(values, periods, block)
+    counts = np.concatenate([[0], np.cumsum(values > 0)])
+    n = len(values)
+    for row, p in enumerate(periods):
+        if p > n:
+            continue
+        nonzero = counts[p:] - counts[:n - p + 1]
+        # windows of all zeros are exactly zero, like pandas' rolling mean
+        sums[row, p - 1:] = np.where(nonzero > 0, np.maximum(sums[row, p - 1:], 0.0), 0.0)
+    return sums / np.asarray(periods, dtype=float)[:, None]
+
+def _rsi_pass(close, periods):
+    n = len(close)
+    diff = np.full(n, np.nan)
+    diff[1:] = close[1:] - close[:-1]
+    gain = np.where(diff > 0, diff, 0.0)
+    loss = np.where(diff < 0, -diff, 0.0)
+    block = max(RSI_BLOCK, max(periods))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = _rolling_means(gain, periods, block) / _rolling_means(loss, periods, block)
+        rsi = 100 - (100 / (1 + rs))
+    return np.nan_to_num(rsi, nan=0.0, posinf=np.inf, neginf=-np.inf)
+
+def rsi_matrix(close, periods):
+    close = np.asarray(close, dtype=float)
+    cache = indicator_cache(close, "rsi")
+    missing = sorted({int(p) for p in periods} - set(cache))
+    if missing and _DISK_CACHE["dir"]:
+        missing = _disk_rows(close, "rsi", cache, missing)
+    if missing:
+        for period, row in zip(missing, _rsi_pass(close, missing)):
+            cache[period] = row
+        _disk_store_rows(close, "rsi", cache)
+    if len(periods) == 0:
+        return np.empty((0, len(close)))
+    return np.stack([cache[int(p)] for p in periods])
+
 def calc_rsi_np(close, period=14):
-    s = pd.Series(close).diff()
-    gain = s.where(s > 0, 0.0).rolling(window=period, min_periods=period).mean()
-    loss = (-s.where(s < 0, 0.0)).rolling(window=period, min_periods=period).mean()
-    rs = gain / loss
-    rsi = 100 - (100 / (1 + rs))
-    return rsi.fillna(0).to_numpy()
+    return rsi_matrix(close, [period])[0]
 
 # -----------------------------
-# Strategy backtester
+# Trade outcome tables
 # -----------------------------
-def run_strategy(data, ema_fast, ema_slow, rsi_period, rsi_buy, rsi_sell, sl_pct, tp_pct,
-                 starting_balance=1000.0, risk_per_trade=20.0, max_lookahead=300):
-    close = data["close"].to_numpy()
-    high = data["high"].to_numpy()
-    low = data["low"].to_numpy()
-    openp = data["open"].to_numpy()
-    n = len(close)
-    if n < 2:
-        return {"balance": starting_balance, "wins": 0, "losses": 0, "trades": 0, "winrate": 0.0}
+# Whether a trade entered at open[i+1] wins or loses depends only on the bar,
+# the direction and the SL/TP percentages -- never on the EMA/RSI parameters.
+# So outcomes are resolved once per (sl_pct, tp_pct) and every combo becomes a
+# masked count over its buy/sell signal masks.
+WIN, LOSS, NO_TRADE = 1, -1, 0
 
-    ema_fast_arr = pd.Series(close).ewm(span=ema_fast, adjust=False).mean().to_numpy()
-    ema_slow_arr = pd.Series(close).ewm(span=ema_slow, adjust=False).mean().to_numpy()
-    rsi_arr = calc_rsi_np(close, period=rsi_period)
+def ohlc_arrays(data):
+    if isinstance(data, tuple):
+        return data
+    return (data["open"].to_numpy(), data["high"].to_numpy(),
+            data["low"].to_numpy(), data["close"].to_numpy())
 
-    signals = np.array([""] * n, dtype=object)
-    buy_mask = (ema_fast_arr > ema_slow_arr) & (rsi_arr < rsi_buy)
-    sell_mask = (ema_fast_arr < ema_slow_arr) & (rsi_arr > rsi_sell)
-    signals[buy_mask] = "BUY"
-    signals[sell_mask] = "SELL"
+def _resolve_scan(high, low, tp_lvl, sl_lvl, side, pending, max_lookahead):
+    n = len(high)
+    codes = np.zeros(n, dtype=np.int8)
+    exits = np.full(n, -1, dtype=np.int64)
+    horizon = n - 1 if max_lookahead is None else min(max_lookahead, n - 1)
+    idx = np.nonzero(pending)[0]
+    for k in range(1, horizon + 1):
+        idx = idx[idx + k < n]
+        if idx.size == 0:
+            break
+        j = idx + k
+        if side == "BUY":
+            tp_hit = high[j] >= tp_lvl[idx]
+            sl_hit = low[j] <= sl_lvl[idx]
+        else:
+            tp_hit = low[j] <= tp_lvl[idx]
+            sl_hit = high[j] >= sl_lvl[idx]
+        done = tp_hit | sl_hit
+        if done.any():
+            # TP and SL on the same bar counts as a loss
+            hit = idx[done]
+            codes[hit] = np.where(sl_hit[done], LOSS, WIN)
+            exits[hit] = j[done]
+            idx = idx[~done]
+    return codes, exits
 
-    balance = float(starting_balance)
-    wins = losses = trades = 0
+# first-passage solver: sparse tables of range max/min answer "first bar in
+# [start, stop) where high >= level / low <= level" in O(log n) per query,
+# so unbounded lookahead costs O(n log n) instead of O(n^2)
+def sparse_table(values, reduce):
+    levels = [values]
+    width = 1
+    while 2 * width <= len(values):
+        prev = levels[-1]
+        levels.append(reduce(prev[:-width], prev[width:]))
+        width *= 2
+    return levels
 
-    for i in range(n - 1):
-        signal = signals[i]
-        if signal == "":
+def first_passage(levels, start, stop, level, above):
+    # binary lifting: skip the longest prefix of [start, stop) with no hit;
+    # fmax/fmin tables ignore NaN bars, which never count as a hit
+    pos = start.copy()
+    for j in range(len(levels) - 1, -1, -1):
+        width = 1 << j
+        fits = pos + width <= stop
+        if not fits.any():
             continue
+        at = np.where(fits, pos, 0)
+        blk = levels[j][np.minimum(at, len(levels[j]) - 1)]
+        hit = (blk >= level) if above else (blk <= level)
+        pos = np.where(fits & ~hit, pos + width, pos)
+    return np.minimum(pos, stop)
+
+def first_exits(tables, start, stop, tp_lvl, sl_lvl, buy):
+    # trades searched over bars [start, stop) of extremum_tables: BUY (buy
+    # True) hits TP on highs and SL on lows, SELL the reverse. Returns
+    # (done, win, exit bar); TP and SL on the same bar counts as a loss
+    high_levels, low_levels = tables
+    t = np.empty(len(start), dtype=np.int64)
+    x = np.empty(len(start), dtype=np.int64)
+    for mask, tp_tables, sl_tables, above in ((buy, high_levels, low_levels, True),
+                                              (~buy, low_levels, high_levels, False)):
+        if mask.all():
+            t[:] = first_passage(tp_tables, start, stop, tp_lvl, above=above)
+            x[:] = first_passage(sl_tables, start, stop, sl_lvl, above=not above)
+        elif mask.any():
+            t[mask] = first_passage(tp_tables, start[mask], stop[mask], tp_lvl[mask], above=above)
+            x[mask] = first_passage(sl_tables, start[mask], stop[mask], sl_lvl[mask], above=not above)
+    done = (t < stop) | (x < stop)
+    return done, done & (t < x), np.minimum(t, x)
+
+def _resolve_sparse(tables, tp_lvl, sl_lvl, side, pending, max_lookahead):
+    n = len(tables[0][0])
+    codes = np.zeros(n, dtype=np.int8)
+    exits = np.full(n, -1, dtype=np.int64)
+    idx = np.nonzero(pending)[0]
+    if idx.size == 0:
+        return codes, exits
+    start = idx + 1
+    stop = np.full(idx.size, n) if max_lookahead is None else np.minimum(n, start + max_lookahead)
+    done, win, exit_bar = first_exits(tables, start, stop, tp_lvl[idx], sl_lvl[idx],
+                                      np.full(idx.size, side == "BUY"))
+    codes[idx[done]] = np.where(win[done], WIN, LOSS)
+    exits[idx[done]] = exit_bar[done]
+    return codes, exits
+
+def extremum_tables(high, low):
+    return sparse_table(high, np.fmax), sparse_table(low, np.fmin)
+
+def pick_resolver(max_lookahead, resolver="auto"):
+    if resolver != "auto":
+        return resolver
+    # a bounded scan touches each pending trade once per bar until it resolves;
+    # past a few hundred bars the log-time sparse tables win
+    return "sparse" if max_lookahead is None or max_lookahead > 512 else "scan"
+
+def build_outcome_table(openp, high, low, sl_pct, tp_pct, max_lookahead=300,
+                        resolver="auto", tables=None):
+    n = len(openp)
+    entry = np.full(n, np.nan)
+    entry[:-1] = openp[1:]
+    pending = ~np.isnan(entry) & (entry != 0)
+    resolver = pick_resolver(max_lookahead, resolver)
+    if resolver == "sparse" and tables is None:
+        cache = indicator_cache(high, "extremum")
+        if "tables" not in cache:
+            cache["tables"] = extremum_tables(high, low)
+        tables = cache["tables"]
+    table = {}
+    for side in ("BUY", "SELL"):
+        if side == "BUY":
+            sl_lvl = entry * (1 - sl_pct)
+            tp_lvl = entry * (1 + tp_pct)
+        else:
+            sl_lvl = entry * (1 + sl_pct)
+            tp_lvl = entry * (1 - tp_pct)
+        if resolver == "sparse":
+            codes, exits = _resolve_sparse(tables, tp_lvl, sl_lvl, side, pending, max_lookahead)
+        else:
+            codes, exits = _resolve_scan(high, low, tp_lvl, sl_lvl, side, pending, max_lookahead)
+        key = side.lower()
+        table[key] = codes
+        table[key + "_exit"] = exits
+    return table
+
+def cached_outcome_table(openp, high, low, sl_pct, tp_pct, max_lookahead=300):
+    # tables are kept per dataset in memory (and on disk with --cache), so
+    # walk-forward windows, chunks and repeated runs build each one once
+    prices = np.concatenate([openp, high, low])
+    cache = indicator_cache(prices, "outcomes")
+    key = (sl_pct, tp_pct, max_lookahead)
+    if key not in cache:
+        disk_key = [dataset_key(prices), float(sl_pct), float(tp_pct), max_lookahead]
+        stored = disk_load("outcomes", disk_key)
+        if stored is None:
+            stored = build_outcome_table(openp, high, low, sl_pct, tp_pct, max_lookahead)
+            disk_save("outcomes", disk_key, dict(stored))
+        cache[key] = stored
+    return cache[key]
+
+def window_outcomes(table, lo, hi):
+    # a full-history table cut to bars [lo, hi): trades resolving at or after
+    # hi are dropped, which is exactly the table built on those bars alone
+    out = {}
+    for key in ("buy", "sell"):
+        exits = table[key + "_exit"]
+        keep = (exits >= 0) & (exits < hi)
+        out[key] = np.where(keep, table[key], NO_TRADE)[lo:hi]
+        out[key + "_exit"] = np.where(keep, exits, -1)[lo:hi]
+    return out
+
+def win_pnl(sl_pct, tp_pct, risk_per_trade=20.0):
+    # a loss costs risk_per_trade, a win pays it scaled by the reward/risk
+    # ratio; SL/TP arrays give one payout per combo
+    if np.ndim(sl_pct) == 0:  # scalar fast path, called once per scored combo
+        return risk_per_trade * (tp_pct / sl_pct) if sl_pct != 0 else risk_per_trade * tp_pct
+    sl_pct = np.asarray(sl_pct, dtype=float)
+    return risk_per_trade * np.where(sl_pct != 0, tp_pct / np.where(sl_pct != 0, sl_pct, 1.0), tp_pct)
 
+def strategy_result(wins, losses, sl_pct, tp_pct, starting_balance=1000.0, risk_per_trade=20.0, metrics=None):
+    # metrics: optional {name: value} of TRADE_METRICS merged into the result
+    trades = wins + losses
+    profit = win_pnl(sl_pct, tp_pct, risk_per_trade)
+    balance = float(starting_balance) + wins * profit - losses * risk_per_trade
+    winrate = (wins / trades * 100.0) if trades > 0 else 0.0
+    result = {"balance": balance, "wins": wins, "losses": losses, "trades": trades, "winrate": winrate}
+    if metrics is not None:
+        result.update((name, float(metrics[name])) for name in TRADE_METRICS)
+    return result
+
+def score_masks(buy_mask, sell_mask, table, sl_pct, tp_pct,
+                starting_balance=1000.0, risk_per_trade=20.0):
+    buy_codes = table["buy"][buy_mask]
+    sell_codes = table["sell"][sell_mask]
+    wins = int(np.count_nonzero(buy_codes == WIN) + np.count_nonzero(sell_codes == WIN))
+    losses = int(np.count_nonzero(buy_codes == LOSS) + np.count_nonzero(sell_codes == LOSS))
+    return strategy_result(wins, losses, sl_pct, tp_pct, starting_balance, risk_per_trade)
+
+# -----------------------------
+# Packed signal bitsets
+# -----------------------------
+# BUY/SELL masks and the per-(SL, TP) win/loss masks are packed 64 bars to a
+# uint64 word (bar i is bit i % 64 of word i // 64). A combo's wins are then
+# popcount(signal & win) summed over the words, and a chunk of combos is one
+# (combos x words) AND + popcount: 1 bit per bar instead of a bool byte, so
+# millions of masks over long M1 histories fit in RAM.
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def pack_bits(masks):
+    # bool (rows x bars) or (bars,) -> uint64 (rows x words)
+    packed = np.packbits(np.atleast_2d(masks), axis=1, bitorder="little")
+    out = np.zeros((packed.shape[0], max(1, -(-packed.shape[1] // 8)) * 8), dtype=np.uint8)
+    out[:, :packed.shape[1]] = packed
+    return out.view(np.uint64)
+
+def popcount(words):
+    # set bits per row of a uint64 (rows x words) array
+    if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    return _POPCOUNT8[words.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+def packed_outcomes(table):
+    # win/loss bitsets of an outcome table, cached inside the table
+    if "buy_win_bits" not in table:
+        for key in ("buy", "sell"):
+            table[key + "_win_bits"] = pack_bits(table[key] == WIN)
+            table[key + "_loss_bits"] = pack_bits(table[key] == LOSS)
+    return table
+
+def score_bits(buy_bits, sell_bits, table):
+    # wins, losses per row of (combos x words) signal bitsets
+    table = packed_outcomes(table)
+    wins = popcount(buy_bits & table["buy_win_bits"]) + popcount(sell_bits & table["sell_win_bits"])
+    losses = popcount(buy_bits & table["buy_loss_bits"]) + popcount(sell_bits & table["sell_loss_bits"])
+    return wins, losses
+
+def _combo_layout(combos):
+    arr = np.array(combos, dtype=float).reshape(len(combos), 7)
+    spans = np.unique(arr[:, :2])
+    periods = np.unique(arr[:, 2])
+    sltp = np.unique(arr[:, 5:7], axis=0)
+    q_of = {tuple(row): q for q, row in enumerate(sltp)}
+    return {
+        "combos": arr, "spans": spans, "periods": periods, "sltp": sltp,
+        "ef_row": np.searchsorted(spans, arr[:, 0]), "es_row": np.searchsorted(spans, arr[:, 1]),
+        "rp_row": np.searchsorted(periods, arr[:, 2]),
+        "q_row": np.array([q_of[tuple(row)] for row in arr[:, 5:7]], dtype=np.int64),
+    }
+
+def _unique_rows(*columns):
+    # distinct rows of the stacked columns and each input row's index into them
+    rows, inverse = np.unique(np.stack(columns, axis=1), axis=0, return_inverse=True)
+    return rows, inverse.reshape(-1)
+
+def _combo_signals(layout, ema, rsi):
+    # ema: (span x bars), rsi: (period x bars) -> int8 codes (combo x bars).
+    # comparisons run once per distinct EMA pair / RSI threshold and are
+    # gathered per combo, so the only combo x bar arrays are booleans
+    combos = layout["combos"]
+    pairs, pair_of = _unique_rows(layout["ef_row"], layout["es_row"])
+    up = ema[pairs[:, 0]] > ema[pairs[:, 1]]
+    down = ema[pairs[:, 0]] < ema[pairs[:, 1]]
+    lows, low_of = _unique_rows(layout["rp_row"], combos[:, 3])
+    highs, high_of = _unique_rows(layout["rp_row"], combos[:, 4])
+    oversold = rsi[lows[:, 0].astype(int)] < lows[:, 1:2]
+    overbought = rsi[highs[:, 0].astype(int)] > highs[:, 1:2]
+    sig = (up[pair_of] & oversold[low_of]).view(np.int8)
+    sig -= (down[pair_of] & overbought[high_of]).view(np.int8)
+    return sig
+
+def combo_signals(close, combos):
+    # (layout, int8 signals) for a batch of combos, one row per combo
+    layout = _combo_layout(combos)
+    return layout, _combo_signals(layout, ema_matrix(close, layout["spans"]), rsi_matrix(close, layout["periods"]))
+
+# -----------------------------
+# Simulation backends
+# -----------------------------
+# Both backends run the same SL/TP simulation over int8 signal codes
+# (1 = BUY, -1 = SELL, 0 = none): "numpy" resolves trades through an outcome
+# table, "numba" compiles the bar loop below. For grid scoring "auto" is
+# numpy: the shared outcome tables and bitsets beat the per-combo compiled
+# loop, which also pays JIT start-up in every process. A single combo
+# (run_strategy, --validate) builds a whole outcome table for one signal
+# row, so there "auto" takes numba when it is installed. --check-backends
+# verifies they agree.
+def signal_codes(buy_mask, sell_mask):
+    codes = np.zeros(len(buy_mask), dtype=np.int8)
+    codes[buy_mask] = 1
+    codes[sell_mask] = -1
+    return codes
+
+def _simulate_kernel(codes, openp, high, low, sl_pct, tp_pct, lookahead):
+    # lookahead < 0 means no limit; no allocation inside the loop
+    n = len(codes)
+    wins = 0
+    losses = 0
+    for i in range(n - 1):
+        side = codes[i]
+        if side == 0:
+            continue
         entry = openp[i + 1]
-        if math.isnan(entry) or entry == 0:
+        if entry != entry or entry == 0:
             continue
-
-        if signal == "BUY":
+        if side > 0:
             sl = entry * (1 - sl_pct)
             tp = entry * (1 + tp_pct)
         else:
             sl = entry * (1 + sl_pct)
             tp = entry * (1 - tp_pct)
+        j_end = n if lookahead < 0 else min(n, i + 1 + lookahead)
+        for j in range(i + 1, j_end):
+            if side > 0:
+                tp_hit = high[j] >= tp
+                sl_hit = low[j] <= sl
+            else:
+                tp_hit = low[j] <= tp
+                sl_hit = high[j] >= sl
+            if sl_hit:
+                losses += 1
+                break
+            if tp_hit:
+                wins += 1
+                break
+    return wins, losses
 
-        j_end = n if (max_lookahead is None) else min(n, i + 1 + max_lookahead)
-        highs = high[i + 1:j_end]
-        lows = low[i + 1:j_end]
+def _simulate_numpy(codes, openp, high, low, sl_pct, tp_pct, max_lookahead, resolver="auto"):
+    table = build_outcome_table(openp, high, low, sl_pct, tp_pct, max_lookahead, resolver)
+    buy = table["buy"][codes == 1]
+    sell = table["sell"][codes == -1]
+    wins = int(np.count_nonzero(buy == WIN) + np.count_nonzero(sell == WIN))
+    losses = int(np.count_nonzero(buy == LOSS) + np.count_nonzero(sell == LOSS))
+    return wins, losses
 
-        if signal == "BUY":
-            tp_hits = np.nonzero(highs >= tp)[0]
-            sl_hits = np.nonzero(lows <= sl)[0]
-        else:
-            tp_hits = np.nonzero(lows <= tp)[0]
-            sl_hits = np.nonzero(highs >= sl)[0]
+def _simulate_compiled(kernel):
+    def simulate(codes, openp, high, low, sl_pct, tp_pct, max_lookahead, resolver="auto"):
+        lookahead = -1 if max_lookahead is None else int(max_lookahead)
+        wins, losses = kernel(codes, np.asarray(openp, dtype=float), np.asarray(high, dtype=float),
+                              np.asarray(low, dtype=float), float(sl_pct), float(tp_pct), lookahead)
+        return int(wins), int(losses)
+    return simulate
 
-        if tp_hits.size == 0 and sl_hits.size == 0:
-            continue  # trade expired without outcome
+BACKENDS = {"numpy": _simulate_numpy, "python": _simulate_compiled(_simulate_kernel)}
+if numba is not None:
+    try:
+        # cache=True keeps the compiled kernel on disk, next to the source
+        _numba_kernel = numba.njit(cache=True)(_simulate_kernel)
+    except RuntimeError:  # run from a sourceless .pyc: nowhere to cache, compile per process
+        _numba_kernel = numba.njit(_simulate_kernel)
+    BACKENDS["numba"] = _simulate_compiled(_numba_kernel)
 
-        t_idx = tp_hits[0] if tp_hits.size > 0 else None
-        s_idx = sl_hits[0] if sl_hits.size > 0 else None
+def warm_backend(backend):
+    # compile before forking workers so each one does not pay for it again
+    prices = np.ones(2)
+    simulate(np.zeros(2, dtype=np.int8), prices, prices, prices, 0.01, 0.01, 1, backend)
 
-        if t_idx is None:
-            outcome = "LOSS"
-        elif s_idx is None:
-            outcome = "WIN"
-        else:
-            outcome = "WIN" if t_idx < s_idx else "LOSS"
+def pick_backend(backend="auto", per_combo=False):
+    # per_combo: one signal row simulated on its own, see the section comment
+    if backend == "auto":
+        return "numba" if per_combo and "numba" in BACKENDS else "numpy"
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown or unavailable backend {backend!r} (have: {', '.join(BACKENDS)})")
+    return backend
 
-        trades += 1
-        if outcome == "WIN":
-            wins += 1
-            profit = risk_per_trade * (tp_pct / sl_pct) if sl_pct != 0 else risk_per_trade * tp_pct
-            balance += profit
-        else:
-            losses += 1
-            balance -= risk_per_trade
+def simulate(codes, openp, high, low, sl_pct, tp_pct, max_lookahead=300, backend="auto", resolver="auto"):
+    return BACKENDS[pick_backend(backend, per_combo=True)](codes, openp, high, low, sl_pct, tp_pct, max_lookahead, resolver)
 
-    winrate = (wins / trades * 100.0) if trades > 0 else 0.0
-    return {"balance": balance, "wins": wins, "losses": losses, "trades": trades, "winrate": winrate}
+# -----------------------------
+# Position-limited simulation
+# -----------------------------
+# By default every signal bar is its own trade, so a trending stretch opens
+# dozens of overlapping positions. With positions=N at most N trades are open
+# at once ("side": one BUY and one SELL); later signals are skipped until a
+# slot frees. A trade holds its slot until its exit bar from the outcome
+# table, or until its lookahead ends when it never resolves. The scan walks
+# signal events only: every combo keeps a pointer into its own events and,
+# while all its slots are busy, jumps straight to its first signal at or
+# after the earliest exit. All combos advance in lockstep, one vectorized
+# step per trade taken or jump made.
+def parse_positions(value):
+    if value is None or value == "side":
+        return value
+    value = int(value)
+    if value < 1:
+        raise ValueError(f"positions must be 'side' or at least 1, got {value}")
+    return value
+
+def take_positions(group, bars, until, slots, n):
+    # events sorted by (group, bar); each group (a combo, or a combo's side)
+    # is scanned on its own. until[k]: bar the k-th trade frees its slot on
+    # (a signal on that bar may enter again, at the next open)
+    taken = np.zeros(len(bars), dtype=bool)
+    if len(bars) == 0:
+        return taken
+    keys = group * (n + 1) + bars
+    starts = np.flatnonzero(np.concatenate([[True], group[1:] != group[:-1]]))
+    ends = np.append(starts[1:], len(bars))
+    ptr = starts.copy()
+    free = np.full((len(starts), slots), -1, dtype=np.int64)
+    active = np.arange(len(starts))
+    while active.size:
+        at = ptr[active]
+        slot = free[active].argmin(axis=1)
+        soonest = free[active, slot]
+        busy = soonest > bars[at]
+        jump = active[busy]
+        ptr[jump] = np.searchsorted(keys, group[at[busy]] * (n + 1) + soonest[busy])
+        take = active[~busy]
+        taken[at[~busy]] = True
+        free[take, slot[~busy]] = until[at[~busy]]
+        ptr[take] += 1
+        active = active[ptr[active] < ends[active]]
+    return taken
+
+def hold_bars(table, openp, max_lookahead=300):
+    # per side: the bar a trade entered on the next open holds its slot
+    # until, -1 where there is no entry (missing or zero open)
+    n = len(openp)
+    bars = np.arange(n)
+    last = np.full(n, n - 1) if max_lookahead is None else np.minimum(n - 1, bars + max_lookahead)
+    entry = np.full(n, np.nan)
+    entry[:-1] = openp[1:]
+    valid = ~np.isnan(entry) & (entry != 0)
+    return {side: np.where(table[side + "_exit"] >= 0, table[side + "_exit"], np.where(valid, last, -1))
+            for side in ("buy", "sell")}
+
+def position_trades(sig, table, hold, positions):
+    # sig: int8 codes (combo x bar) sharing one SL/TP -> the trades taken as
+    # (row, bar, is-buy, outcome) columns in (row, bar) order
+    rows, bars = np.nonzero(sig)
+    buy = sig[rows, bars] == 1
+    until = np.where(buy, hold["buy"][bars], hold["sell"][bars])
+    keep = until >= 0
+    rows, bars, buy, until = rows[keep], bars[keep], buy[keep], until[keep]
+    if positions == "side":
+        # one slot per side: BUY and SELL events become separate groups
+        group = rows * 2 + ~buy
+        order = np.lexsort((bars, group))
+        taken = np.zeros(len(bars), dtype=bool)
+        taken[order] = take_positions(group[order], bars[order], until[order], 1, sig.shape[1])
+    else:
+        taken = take_positions(rows, bars, until, int(positions), sig.shape[1])
+    outcome = np.where(buy, table["buy"][bars], table["sell"][bars])
+    return rows[taken], bars[taken], buy[taken], outcome[taken]
+
+def position_counts(sig, table, hold, positions):
+    # wins, losses per combo row of sig
+    rows, _, _, outcome = position_trades(sig, table, hold, positions)
+    wins = np.bincount(rows[outcome == WIN], minlength=len(sig))
+    losses = np.bincount(rows[outcome == LOSS], minlength=len(sig))
+    return wins, losses
+
+# -----------------------------
+# Trade ledger and metrics
+# -----------------------------
+# A ledger is one row per resolved trade in columns: combo (row in the
+# scored batch), entry bar (the open it fills at), exit bar, direction
+# (1 = BUY, -1 = SELL) and P&L. Equity only moves on exit bars, so per-combo
+# equity curves are a (combo x distinct exit bar) matrix of summed P&L and
+# drawdown, profit factor and expectancy are reductions over it -- for a
+# whole batch at once, straight from the outcome table.
+LEDGER_COLUMNS = (("combo", "<i8"), ("entry", "<i8"), ("exit", "<i8"), ("direction", "<i1"), ("pnl", "<f8"))
+TRADE_METRICS = ("max_drawdown", "profit_factor", "expectancy")
+_LEDGER_BUDGET = 64 << 20  # bytes of equity matrix per block of combos
+
+def group_trades(sig, table, hold=None, positions=None):
+    # resolved trades of the rows of sig (one SL/TP) -> (row, bar, is-buy,
+    # outcome); with positions, expired trades still held their slot
+    if positions is not None:
+        rows, bars, buy, outcome = position_trades(sig, table, hold, positions)
+    else:
+        rows, bars = np.nonzero(sig)
+        buy = sig[rows, bars] == 1
+        outcome = np.where(buy, table["buy"][bars], table["sell"][bars])
+    keep = outcome != NO_TRADE
+    return rows[keep], bars[keep], buy[keep], outcome[keep]
+
+def trade_ledger(data, combos, max_lookahead=300, positions=None, risk_per_trade=20.0):
+    openp, high, low, close = ohlc_arrays(data)
+    layout, sig = combo_signals(close, combos)
+    parts = []
+    for q, (sl, tp) in enumerate(layout["sltp"]):
+        members = np.nonzero(layout["q_row"] == q)[0]
+        table = cached_outcome_table(openp, high, low, sl, tp, max_lookahead)
+        hold = hold_bars(table, openp, max_lookahead) if positions is not None else None
+        rows, bars, buy, outcome = group_trades(sig[members], table, hold, positions)
+        exits = np.where(buy, table["buy_exit"][bars], table["sell_exit"][bars])
+        pnl = np.where(outcome == WIN, win_pnl(sl, tp, risk_per_trade), -risk_per_trade)
+        parts.append((members[rows], bars + 1, exits, np.where(buy, 1, -1).astype(np.int8), pnl))
+    columns = [np.concatenate(cols) for cols in zip(*parts)]
+    order = np.lexsort((columns[1], columns[2], columns[0]))  # by combo, then exit, then entry
+    return {name: col[order].astype(dtype) for (name, dtype), col in zip(LEDGER_COLUMNS, columns)}
+
+def ledger_metrics(combo, exits, pnl, n_combos, starting_balance=1000.0):
+    # per combo: max drawdown of the equity curve, profit factor (gross win /
+    # gross loss, inf without losses) and expectancy (mean P&L per trade)
+    gross_win = np.bincount(combo, weights=np.maximum(pnl, 0), minlength=n_combos)
+    gross_loss = np.bincount(combo, weights=np.maximum(-pnl, 0), minlength=n_combos)
+    trades = np.bincount(combo, minlength=n_combos)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        profit_factor = np.where(gross_loss > 0, gross_win / gross_loss, np.where(gross_win > 0, np.inf, 0.0))
+        expectancy = np.where(trades > 0, (gross_win - gross_loss) / np.maximum(trades, 1), 0.0)
+    drawdown = np.zeros(n_combos)
+    bars, col = np.unique(exits, return_inverse=True)
+    col = col.reshape(-1)
+    step = max(1, _LEDGER_BUDGET // (16 * max(1, len(bars))))
+    for lo in range(0, n_combos, step):
+        hi = min(n_combos, lo + step)
+        keep = (combo >= lo) & (combo < hi)
+        cells = np.bincount((combo[keep] - lo) * len(bars) + col[keep], weights=pnl[keep],
+                            minlength=(hi - lo) * len(bars)).reshape(hi - lo, len(bars))
+        equity = starting_balance + np.cumsum(cells, axis=1)
+        peak = np.maximum(np.maximum.accumulate(equity, axis=1), starting_balance)
+        drawdown[lo:hi] = (peak - equity).max(axis=1, initial=0.0)
+    return {"max_drawdown": drawdown, "profit_factor": profit_factor, "expectancy": expectancy}
+
+def save_ledger(path, ledger, rows):
+    # rows: the scored combos' leaderboard rows; their idx and parameters are
+    # stored alongside so the ledger file is self-describing
+    tmp = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(tmp, **ledger, idx=np.array([row["idx"] for row in rows], dtype=np.int64),
+                        params=np.array([[row[name] for name in COMBO_PARAMS] for row in rows], dtype=float))
+    os.replace(tmp, path)
+
+# -----------------------------
+# Strategy backtester
+# -----------------------------
+def signal_masks(close, ema_fast, ema_slow, rsi_period, rsi_buy, rsi_sell):
+    ema_fast_arr, ema_slow_arr = ema_matrix(close, [ema_fast, ema_slow])
+    rsi_arr = calc_rsi_np(close, period=rsi_period)
+
+    buy_mask = (ema_fast_arr > ema_slow_arr) & (rsi_arr < rsi_buy)
+    sell_mask = (ema_fast_arr < ema_slow_arr) & (rsi_arr > rsi_sell)
+    return buy_mask, sell_mask
+
+def run_strategy(data, ema_fast, ema_slow, rsi_period, rsi_buy, rsi_sell, sl_pct, tp_pct,
+                 starting_balance=1000.0, risk_per_trade=20.0, max_lookahead=300, outcomes=None,
+                 resolver="auto", backend="auto", window=None, masks=None, shards=1, positions=None):
+    if positions is not None and (window is not None or isinstance(data, dict)):
+        raise ValueError("positions applies to full in-memory arrays only")
+    if isinstance(data, dict) and data.get("kind") == "ohlc-store":
+        # memory-mapped store: streamed in chunks, see score_store
+        return score_store(data, [(ema_fast, ema_slow, rsi_period, rsi_buy, rsi_sell, sl_pct, tp_pct)],
+                           max_lookahead, None, starting_balance, risk_per_trade)[0]
+    if shards > 1 and outcomes is None and window is None and masks is None and positions is None:
+        # one long series over several cores, see run_sharded
+        return run_sharded(data, (ema_fast, ema_slow, rsi_period, rsi_buy, rsi_sell, sl_pct, tp_pct), shards,
+                           starting_balance, risk_per_trade, max_lookahead)
+    openp, high, low, close = ohlc_arrays(data)
+    n = len(close)
+    if n < 2:
+        return {"balance": starting_balance, "wins": 0, "losses": 0, "trades": 0, "winrate": 0.0}
+
+    buy_mask, sell_mask = masks if masks is not None else signal_masks(close, ema_fast, ema_slow, rsi_period,
+                                                                       rsi_buy, rsi_sell)
+
+    # window=(lo, hi): score only bars lo..hi-1 and trades that close before
+    # hi; indicators keep their warm-up from the bars before lo
+    if window is not None:
+        lo, hi = window
+        if outcomes is None:
+            outcomes = cached_outcome_table(openp, high, low, sl_pct, tp_pct, max_lookahead)
+        outcomes = window_outcomes(outcomes, lo, hi)
+        buy_mask, sell_mask = buy_mask[lo:hi], sell_mask[lo:hi]
+
+    # positions: cap on concurrent trades, see position_counts
+    if positions is not None:
+        if outcomes is None:
+            outcomes = cached_outcome_table(openp, high, low, sl_pct, tp_pct, max_lookahead)
+        wins, losses = position_counts(signal_codes(buy_mask, sell_mask)[None], outcomes,
+                                       hold_bars(outcomes, openp, max_lookahead), positions)
+        return strategy_result(int(wins[0]), int(losses[0]), sl_pct, tp_pct, starting_balance, risk_per_trade)
+    # outcomes: precomputed table for this (sl_pct, tp_pct), see cached_outcome_table
+    if outcomes is not None:
+        return score_masks(buy_mask, sell_mask, outcomes, sl_pct, tp_pct, starting_balance, risk_per_trade)
+    codes = signal_codes(buy_mask, sell_mask)
+    wins, losses = simulate(codes, openp, high, low, sl_pct, tp_pct, max_lookahead, backend, resolver)
+    return strategy_result(wins, losses, sl_pct, tp_pct, starting_balance, risk_per_trade)
+
+# Signal dedup: on a short window many combos (different RSI thresholds or
+# EMA pairs) produce exactly the same BUY/SELL masks. Results are keyed on
+# (SL, TP, digest of the packed masks), so a repeated mask reuses the first
+# combo's result and only unique signal sets pay for trade resolution.
+# The stored results are a bounded LRU (a reused key moves to the back, the
+# front is evicted): repeats cluster within a chunk of neighbouring combos,
+# so a cap keeps memory flat on grids of millions without losing hits.
+_DEDUP_SIZE = 1 << 17
+
+def new_dedup():
+    # fresh: positions of the last call's combos that were scored, not reused
+    return {"combos": 0, "unique": 0, "results": {}, "fresh": np.zeros(0, dtype=np.int64)}
+
+def fresh_flags(dedup, count):
+    flags = np.zeros(count, dtype=bool)
+    flags[dedup["fresh"]] = True
+    return flags
+
+def bits_digest(buy_bits, sell_bits):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(buy_bits.tobytes())
+    h.update(sell_bits.tobytes())
+    return h.digest()
+
+
+def dedup_ratio(stats):
+    return 1.0 - stats["unique"] / stats["combos"] if stats["combos"] else 0.0
+
+def score_combos(data, combos, max_lookahead=300, outcome_tables=None, backend="numpy", dedup=None,
+                 starting_balance=1000.0, risk_per_trade=20.0, positions=None, metrics=False):
+    # outcome_tables is filled lazily so callers can keep it across chunks;
+    # compiled backends simulate each unique combo directly instead. dedup
+    # (see new_dedup) must only be shared between calls on the same data and
+    # positions/metrics settings; both always score through the outcome tables.
+    # metrics adds TRADE_METRICS to every result
+    openp, high, low, close = ohlc_arrays(data)
+    if outcome_tables is None:
+        outcome_tables = {}
+    backend = pick_backend(backend)
+    if not combos:
+        return []
+    if len(close) < 2:
+        # no bar to enter on: no trades, and zero metrics when asked for
+        empty = dict.fromkeys(TRADE_METRICS, 0.0) if metrics else None
+        return [strategy_result(0, 0, sl, tp, starting_balance, risk_per_trade, empty) for *_, sl, tp in combos]
+    # the whole batch at once; BUY and SELL never overlap, so the int8 rows
+    # are also the signal codes the simulation backends take
+    layout, sig = combo_signals(close, combos)
+    buy_bits, sell_bits = pack_bits(sig == 1), pack_bits(sig == -1)
+    results = [None] * len(combos)
+    todo = list(range(len(combos)))
+    if dedup is not None:
+        keys = [(sl, tp, bits_digest(buy_bits[i], sell_bits[i])) for i, (*_, sl, tp) in enumerate(combos)]
+        todo, first = [], set()
+        for i, key in enumerate(keys):
+            if key in dedup["results"]:
+                results[i] = dict(dedup["results"][key])
+                dedup["results"][key] = dedup["results"].pop(key)
+            elif key not in first:  # later duplicates are filled below
+                first.add(key)
+                todo.append(i)
+        dedup["combos"] += len(combos)
+        dedup["unique"] += len(todo)
+    todo = np.array(todo, dtype=np.int64)
+    if dedup is not None:
+        dedup["fresh"] = todo
+    for q in range(len(layout["sltp"])):
+        rows = todo[layout["q_row"][todo] == q]
+        if rows.size == 0:
+            continue
+        sl, tp = combos[rows[0]][5], combos[rows[0]][6]
+        if backend == "numpy" or positions is not None or metrics:
+            if (sl, tp) not in outcome_tables:
+                outcome_tables[(sl, tp)] = cached_outcome_table(openp, high, low, sl, tp, max_lookahead)
+            table = outcome_tables[(sl, tp)]
+        hold = None
+        if positions is not None:
+            if ("hold", sl, tp) not in outcome_tables:
+                outcome_tables[("hold", sl, tp)] = hold_bars(table, openp, max_lookahead)
+            hold = outcome_tables[("hold", sl, tp)]
+        extra = None
+        if positions is not None or metrics:
+            trade_rows, bars, buy, outcome = group_trades(sig[rows], table, hold, positions)
+            counts = zip(np.bincount(trade_rows[outcome == WIN], minlength=len(rows)),
+                         np.bincount(trade_rows[outcome == LOSS], minlength=len(rows)))
+            if metrics:
+                exits = np.where(buy, table["buy_exit"][bars], table["sell_exit"][bars])
+                pnl = np.where(outcome == WIN, win_pnl(sl, tp, risk_per_trade), -risk_per_trade)
+                extra = ledger_metrics(trade_rows, exits, pnl, len(rows), starting_balance)
+        elif backend == "numpy":
+            counts = zip(*score_bits(buy_bits[rows], sell_bits[rows], table))
+        else:
+            counts = (simulate(sig[i], openp, high, low, sl, tp, max_lookahead, backend) for i in rows)
+        for k, (i, (w, l)) in enumerate(zip(rows, counts)):
+            row_metrics = None if extra is None else {name: extra[name][k] for name in TRADE_METRICS}
+            results[i] = strategy_result(int(w), int(l), sl, tp, starting_balance, risk_per_trade, row_metrics)
+    if dedup is not None:
+        scored = {keys[i]: results[i] for i in todo}
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                results[i] = dict(scored[key])
+        stored = dedup["results"]
+        stored.update(scored)
+        while len(stored) > _DEDUP_SIZE:
+            stored.pop(next(iter(stored)))
+    return results
 
 # -----------------------------
 # Load MT5 JSON data
 # -----------------------------
+# parsed files are kept per (path, mtime, size) so a long-lived process
+# (--serve) does not re-parse a candle file that has not changed
+_DATA_CACHE = {}
+_DATA_CACHE_SIZE = 8
+
 def load_mt5_json(path):
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    if key in _DATA_CACHE:
+        symbol, timeframe, df = _DATA_CACHE[key]
+        return symbol, timeframe, df.copy()
     with open(path, "r") as f:
         payload = json.load(f)
     candles = payload.get("candles", [])
@@ -113,79 +957,1918 @@ def load_mt5_json(path):
         df[col] = pd.to_numeric(df[col], errors="coerce")
     df["time"] = pd.to_datetime(df["time"])
     df = df[["time", "open", "high", "low", "close", "tick_volume"]].sort_values("time").reset_index(drop=True)
-    return payload.get("symbol", "UNKNOWN"), payload.get("timeframe", "?"), df
+    while len(_DATA_CACHE) >= _DATA_CACHE_SIZE:
+        _DATA_CACHE.pop(next(iter(_DATA_CACHE)))
+    _DATA_CACHE[key] = (payload.get("symbol", "UNKNOWN"), payload.get("timeframe", "?"), df)
+    return payload.get("symbol", "UNKNOWN"), payload.get("timeframe", "?"), df.copy()
+
+# -----------------------------
+# Timeframe resampling
+# -----------------------------
+# One M1 download feeds every timeframe: higher timeframes are built from the
+# loaded bars in one vectorized pass (bars grouped by the period their time
+# falls in, like MT5's own candles) and cached per source dataset.
+TIMEFRAME_MINUTES = {"M1": 1, "M5": 5, "M15": 15, "M30": 30, "H1": 60, "H4": 240, "D1": 1440}
+
+def timeframe_minutes(timeframe):
+    if timeframe not in TIMEFRAME_MINUTES:
+        raise ValueError(f"unknown timeframe {timeframe!r} (have: {', '.join(TIMEFRAME_MINUTES)})")
+    return TIMEFRAME_MINUTES[timeframe]
+
+def parse_timeframes(text):
+    timeframes = [tf.strip().upper() for tf in text.split(",") if tf.strip()]
+    for tf in timeframes:
+        timeframe_minutes(tf)
+    return timeframes
+
+def resample_candles(df, source, target):
+    if target == source or len(df) == 0:
+        return df
+    minutes = timeframe_minutes(target)
+    if minutes % timeframe_minutes(source):
+        raise ValueError(f"cannot build {target} candles from {source}")
+    cache = indicator_cache(df["close"].to_numpy(dtype=float), "timeframes")
+    if target not in cache:
+        period_ns = minutes * 60 * 10**9
+        period = df["time"].to_numpy().astype("datetime64[ns]").astype(np.int64) // period_ns
+        starts = np.flatnonzero(np.concatenate([[True], period[1:] != period[:-1]]))
+        ends = np.append(starts[1:], len(df)) - 1
+        cache[target] = pd.DataFrame({
+            "time": pd.to_datetime(period[starts] * period_ns),
+            "open": df["open"].to_numpy(dtype=float)[starts],
+            "high": np.fmax.reduceat(df["high"].to_numpy(dtype=float), starts),
+            "low": np.fmin.reduceat(df["low"].to_numpy(dtype=float), starts),
+            "close": df["close"].to_numpy(dtype=float)[ends],
+            "tick_volume": np.add.reduceat(df["tick_volume"].fillna(0).to_numpy(dtype=float), starts)})
+    return cache[target].copy()
+
+# -----------------------------
+# Parameter grid spec
+# -----------------------------
+# The grid is declarative: value lists (or {"start", "stop", "step"} ranges,
+# stop inclusive), per-asset-type overrides and pairwise constraints such as
+# "ema_fast < ema_slow". It is expanded lazily in COMBO_PARAMS order and can
+# be split into N deterministic round-robin shards. Pass --grid grid.json to
+# replace DEFAULT_GRID.
+COMBO_PARAMS = ("ema_fast", "ema_slow", "rsi_period", "rsi_buy", "rsi_sell", "sl", "tp")
+
+DEFAULT_GRID = {
+    "params": {
+        "ema_fast": [5, 9, 12],
+        "ema_slow": [21, 30, 50],
+        "rsi_period": [7, 14],
+        "rsi_buy": [40, 45, 50],
+        "rsi_sell": [50, 55, 60],
+    },
+    "asset_types": {"CRYPTO": ["BTC", "ETH", "XAU"]},
+    "default_asset_type": "FX",
+    "overrides": {
+        "FX": {"sl": [0.0005, 0.001], "tp": [0.001, 0.002]},    # 0.05%–0.1% / 0.1%–0.2%
+        "CRYPTO": {"sl": [0.005, 0.01], "tp": [0.01, 0.02]},    # 0.5%–1% / 1%–2%
+    },
+    "constraints": ["ema_fast < ema_slow"],
+}
+
+CONSTRAINT_OPS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+                  "==": operator.eq, "!=": operator.ne}
+
+def load_grid_spec(path=None):
+    if path is None:
+        return DEFAULT_GRID
+    with open(path, "r") as f:
+        return json.load(f)
+
+def expand_values(values):
+    if isinstance(values, dict):
+        start, stop, step = values["start"], values["stop"], values.get("step", 1)
+        count = int(math.floor((stop - start) / step + 1e-9)) + 1
+        if all(isinstance(v, int) for v in (start, stop, step)):
+            return [start + k * step for k in range(count)]
+        return [round(start + k * step, 10) for k in range(count)]
+    return list(values)
 
 # -----------------------------
 # Detect asset type
 # -----------------------------
-def detect_asset_type(symbol):
+def detect_asset_type(symbol, spec=None):
+    spec = spec or DEFAULT_GRID
     symbol = symbol.upper()
-    if "BTC" in symbol or "ETH" in symbol or "XAU" in symbol:
-        return "CRYPTO"
-    return "FX"
+    for asset_type, patterns in spec.get("asset_types", {}).items():
+        if any(p in symbol for p in patterns):
+            return asset_type
+    return spec.get("default_asset_type", "FX")
+
+def grid_ranges(asset_type, spec=None):
+    spec = spec or DEFAULT_GRID
+    params = dict(spec.get("params", {}))
+    params.update(spec.get("overrides", {}).get(asset_type, {}))
+    missing = [name for name in COMBO_PARAMS if name not in params]
+    if missing:
+        raise ValueError(f"grid spec has no values for {', '.join(missing)} (asset type {asset_type})")
+    return {name: expand_values(params[name]) for name in COMBO_PARAMS}
+
+def parse_constraint(text, names=COMBO_PARAMS):
+    parts = text.split()
+    if len(parts) != 3 or parts[1] not in CONSTRAINT_OPS:
+        raise ValueError(f"bad constraint {text!r}, expected e.g. 'ema_fast < ema_slow'")
+    left, op, right = parts
+    operands = []
+    for token in (left, right):
+        operands.append(token if token in names else float(token))
+    return operands[0], CONSTRAINT_OPS[op], operands[1]
+
+def _constraint_filter(constraints):
+    parsed = [parse_constraint(c) for c in constraints]
+
+    def value(operand, params):
+        return params[operand] if isinstance(operand, str) else operand
+
+    def ok(params):
+        return all(op(value(a, params), value(b, params)) for a, op, b in parsed)
+    return parsed, ok
+
+def iter_grid(ranges, constraints=(), shard=None):
+    # yields (idx, combo) with idx counting valid combos from 1; shard=(k, N)
+    # keeps every N-th combo starting at the k-th
+    _, ok = _constraint_filter(constraints)
+    k, count = shard or (1, 1)
+    idx = 0
+    for combo in itertools.product(*(ranges[name] for name in COMBO_PARAMS)):
+        if constraints and not ok(dict(zip(COMBO_PARAMS, combo))):
+            continue
+        idx += 1
+        if (idx - 1) % count == k - 1:
+            yield idx, combo
+
+def grid_size(ranges, constraints=(), shard=None):
+    # counts without expanding: only the constrained parameters are enumerated
+    parsed, ok = _constraint_filter(constraints)
+    involved = [name for name in COMBO_PARAMS
+                if any(name in (a, b) for a, _, b in parsed)]
+    size = sum(1 for values in itertools.product(*(ranges[name] for name in involved))
+               if ok(dict(zip(involved, values))))
+    for name in COMBO_PARAMS:
+        if name not in involved:
+            size *= len(ranges[name])
+    if shard is None:
+        return size
+    k, count = shard
+    return max(0, -(-(size - (k - 1)) // count))
+
+def parse_shard(text):
+    k, count = (int(v) for v in text.split("/"))
+    if not 1 <= k <= count:
+        raise ValueError(f"bad shard {text!r}, expected k/N with 1 <= k <= N")
+    return k, count
 
 # -----------------------------
-# Main bruteforce
+# Parallel grid search
 # -----------------------------
-def main(path, max_lookahead=300):
+# OHLC arrays are copied once into a shared-memory block; workers attach to it
+# and score chunks of the combo stream, a bounded number of chunks in flight.
+# Results carry their combo index so the merge picks the same best as the
+# serial run (highest balance, earliest index on ties) whatever the worker
+# count or completion order.
+_WORKER = {}
+
+def _attach_worker(shm_name, n, max_lookahead, backend, positions=None, metrics=False):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = np.ndarray((4, n), dtype=float, buffer=shm.buf)
+    _WORKER.update(shm=shm, data=tuple(arrays), max_lookahead=max_lookahead, outcomes={}, backend=backend,
+                   dedup=new_dedup(), positions=positions, metrics=metrics)
+
+def _score_chunk(chunk):
+    # returns the rows and which of them needed a fresh (non-deduped) score
+    combos = [combo for _, combo in chunk]
+    results = score_combos(_WORKER["data"], combos, _WORKER["max_lookahead"], _WORKER["outcomes"],
+                           _WORKER["backend"], _WORKER["dedup"], positions=_WORKER["positions"],
+                           metrics=_WORKER["metrics"])
+    return [(idx, combo, res) for (idx, combo), res in zip(chunk, results)], fresh_flags(_WORKER["dedup"], len(chunk))
+
+def iter_chunks(items, chunk_size):
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def _count_dedup(stats, fresh):
+    # one combo handed to the caller; counted as it is yielded, so counters
+    # saved in a checkpoint cover exactly the combos finished so far
+    if stats is not None:
+        stats["combos"] += 1
+        stats["unique"] += int(fresh)
+
+def iter_results_serial(df, items, max_lookahead=300, chunk_size=200, backend="numpy", stats=None,
+                        positions=None, metrics=False):
+    # items: iterable of (idx, combo); yields (idx, combo, result).
+    # stats: optional {"combos", "unique"} counters for the dedup report
+    data = ohlc_arrays(df)
+    outcome_tables = {}
+    dedup = new_dedup()
+    for chunk in iter_chunks(items, chunk_size):
+        results = score_combos(data, [combo for _, combo in chunk], max_lookahead, outcome_tables, backend, dedup,
+                               positions=positions, metrics=metrics)
+        for (idx, combo), res, fresh in zip(chunk, results, fresh_flags(dedup, len(chunk))):
+            _count_dedup(stats, fresh)
+            yield idx, combo, res
+
+def iter_results_parallel(df, items, max_lookahead=300, workers=2, chunk_size=200, backend="numpy",
+                          stats=None, positions=None, metrics=False):
+    arrays = np.stack(ohlc_arrays(df)).astype(float)
+    n = arrays.shape[1]
+    warm_backend(backend)
+    shm = shared_memory.SharedMemory(create=True, size=max(arrays.nbytes, 1))
+    try:
+        np.ndarray(arrays.shape, dtype=float, buffer=shm.buf)[:] = arrays
+        with mp.Pool(workers, initializer=_attach_worker, initargs=(shm.name, n, max_lookahead, backend, positions, metrics)) as pool:
+            chunks = iter_chunks(items, chunk_size)
+            while True:
+                wave = list(itertools.islice(chunks, workers * 4))
+                if not wave:
+                    break
+                for results, fresh in pool.imap_unordered(_score_chunk, wave):
+                    for row, new in zip(results, fresh):
+                        _count_dedup(stats, new)
+                        yield row
+    finally:
+        shm.close()
+        shm.unlink()
+
+def iter_results(df, items, max_lookahead=300, workers=1, backend="numpy", stats=None, positions=None,
+                 metrics=False):
+    if workers > 1:
+        return iter_results_parallel(df, items, max_lookahead, workers, backend=backend, stats=stats,
+                                     positions=positions, metrics=metrics)
+    return iter_results_serial(df, items, max_lookahead, backend=backend, stats=stats, positions=positions,
+                               metrics=metrics)
+
+# -----------------------------
+# Time-sharded backtest
+# -----------------------------
+# One strategy over a very long history: the bars are cut into shards that
+# start on RSI block boundaries and are scored by separate processes. Each
+# shard warms its EMAs up over the bars before it (from a cold start, like
+# the series start) and recomputes RSI over a two-block overlap; trades still
+# open at a shard's end are handed back to the merge, which resolves them on
+# the full arrays. The merge also checks each shard's warmed-up EMAs against
+# the exact values the previous shard ended with and re-runs the shard from
+# those on a mismatch, so the result is exactly the serial run's.
+def _ema_warmup(span):
+    # bars for (span-1)/(span+1)**k to fall below float64 rounding
+    return max(RSI_BLOCK, 32 * int(span))
+
+def _ewm(close, span, init=None):
+    # pandas' C loop, same values as _ema_pass on NaN-free closes; init is
+    # continued from by seeding the series with it
+    if init is not None:
+        return pd.Series(np.concatenate([[init], close])).ewm(span=span, adjust=False).mean().to_numpy()[1:]
+    return pd.Series(close).ewm(span=span, adjust=False).mean().to_numpy()
+
+def _shard_pass(data, s, e, params, max_lookahead, ema_init=None):
+    ema_fast, ema_slow, rsi_period, rsi_buy, rsi_sell, sl_pct, tp_pct = params
+    openp, high, low, close = data
+    n = len(close)
+    out = {"ema_before": None}
+    if ema_init is None:
+        warm = max(0, s - _ema_warmup(max(ema_fast, ema_slow)))
+        ema = np.stack([_ewm(close[warm:e], span) for span in (ema_fast, ema_slow)])
+        if s > warm:
+            out["ema_before"] = ema[:, s - warm - 1]
+        ema = ema[:, s - warm:]
+    else:
+        ema = np.stack([_ewm(close[s:e], span, v) for span, v in zip((ema_fast, ema_slow), ema_init)])
+    out["ema_end"] = ema[:, -1]
+    block = max(RSI_BLOCK, int(rsi_period))
+    r0 = max(0, s - 2 * block)
+    rsi = _rsi_pass(close[r0:e], [int(rsi_period)])[0, s - r0:]
+    codes = signal_codes((ema[0] > ema[1]) & (rsi < rsi_buy), (ema[0] < ema[1]) & (rsi > rsi_sell))
+
+    # trades entered at open[i+1], resolved within this shard's bars
+    bars = s + np.nonzero(codes[:min(e, n - 1) - s])[0]
+    entry = openp[bars + 1]
+    ok = ~np.isnan(entry) & (entry != 0)
+    bars, entry = bars[ok], entry[ok]
+    buy = codes[bars - s] == 1
+    tp_lvl = np.where(buy, entry * (1 + tp_pct), entry * (1 - tp_pct))
+    sl_lvl = np.where(buy, entry * (1 - sl_pct), entry * (1 + sl_pct))
+    last = np.full(len(bars), n - 1) if max_lookahead is None else np.minimum(n - 1, bars + max_lookahead)
+    start = bars + 1 - s
+    stop = np.maximum(np.minimum(last, e - 1) + 1 - s, start)
+    done, win, _ = first_exits(extremum_tables(high[s:e], low[s:e]), start, stop, tp_lvl, sl_lvl, buy)
+    out["wins"] = int(np.count_nonzero(win))
+    out["losses"] = int(np.count_nonzero(done)) - out["wins"]
+    carry = ~done & (last >= e)
+    out["pending"] = (buy[carry], tp_lvl[carry], sl_lvl[carry], last[carry])
+    return out
+
+def _shard_task(task):
+    return _shard_pass(_WORKER["data"], *task)
+
+def _resolve_pending(high, low, first, buy, tp_lvl, sl_lvl, last):
+    # trades still open at bar `first`: scan forward in doubling windows
+    wins = losses = 0
+    for is_buy, tp, sl, end in zip(buy, tp_lvl, sl_lvl, last):
+        pos, width = first, 64
+        while pos <= end:
+            stop = min(end + 1, pos + width)
+            if is_buy:
+                tp_hit, sl_hit = high[pos:stop] >= tp, low[pos:stop] <= sl
+            else:
+                tp_hit, sl_hit = low[pos:stop] <= tp, high[pos:stop] >= sl
+            hit = np.nonzero(tp_hit | sl_hit)[0]
+            if hit.size:
+                if sl_hit[hit[0]]:
+                    losses += 1
+                else:
+                    wins += 1
+                break
+            pos, width = stop, width * 2
+    return wins, losses
+
+def shard_bounds(n, shards, rsi_period, span):
+    block = max(RSI_BLOCK, int(rsi_period))
+    # shards shorter than the EMA warm-up would mostly redo their neighbour's bars
+    shards = max(1, min(shards, n // max(block, _ema_warmup(span))))
+    step = -(-n // shards // block) * block
+    return [(s, min(n, s + step)) for s in range(0, n, step)]
+
+def run_sharded(data, params, shards, starting_balance=1000.0, risk_per_trade=20.0, max_lookahead=300):
+    arrays = np.stack(ohlc_arrays(data)).astype(float)
+    n = arrays.shape[1]
+    ema_fast, ema_slow, rsi_period = params[:3]
+    bounds = shard_bounds(n, shards, rsi_period, max(ema_fast, ema_slow))
+    if len(bounds) < 2 or np.isnan(arrays[3]).any():
+        # gaps in close follow pandas' EMA weighting, which only the serial path reproduces
+        return run_strategy(data, *params, starting_balance, risk_per_trade, max_lookahead)
+    shm = shared_memory.SharedMemory(create=True, size=arrays.nbytes)
+    try:
+        np.ndarray(arrays.shape, dtype=float, buffer=shm.buf)[:] = arrays
+        with mp.Pool(min(len(bounds), os.cpu_count() or 1), initializer=_attach_worker,
+                     initargs=(shm.name, n, max_lookahead, "numpy")) as pool:
+            parts = pool.map(_shard_task, [(s, e, params, max_lookahead) for s, e in bounds])
+    finally:
+        shm.close()
+        shm.unlink()
+    wins = losses = 0
+    pending = []
+    for k, ((s, e), part) in enumerate(zip(bounds, parts)):
+        if k and not np.array_equal(part["ema_before"], parts[k - 1]["ema_end"]):
+            # warm-up did not converge bit for bit: continue from the exact values
+            part = parts[k] = _shard_pass(arrays, s, e, params, max_lookahead, parts[k - 1]["ema_end"])
+        wins += part["wins"]
+        losses += part["losses"]
+        pending.append((e, part["pending"]))
+    for e, (buy, tp_lvl, sl_lvl, last) in pending:
+        w, l = _resolve_pending(arrays[1], arrays[2], e, buy, tp_lvl, sl_lvl, last)
+        wins += w
+        losses += l
+    return strategy_result(wins, losses, params[5], params[6], starting_balance, risk_per_trade)
+
+# -----------------------------
+# Successive halving
+# -----------------------------
+# Score every combo on a recent slice, keep the best 1/eta, and re-score the
+# survivors on a slice eta times longer, until the last rung is the full
+# history (scored by main as usual). Rungs never go below min_bars.
+def halving_schedule(n, total, eta=3, min_bars=100):
+    rungs = []
+    bars, count = n // eta, total
+    while bars >= min_bars and count > 1:
+        rungs.insert(0, bars)
+        bars, count = bars // eta, -(-count // eta)
+    return rungs
+
+def successive_halving(df, items, total, max_lookahead=300, workers=1, backend="numpy", eta=3, min_bars=100,
+                       stats=None, positions=None):
+    # items: re-iterable source of (idx, combo); returns the survivors as a list
+    n = len(df)
+    survivors = items
+    count = total
+    cost = 0
+    for bars in halving_schedule(n, total, eta, min_bars):
+        window = df.iloc[-bars:].reset_index(drop=True)
+        keep = max(1, -(-count // eta))
+        # bounded min-heap of the best `keep`: highest balance, earliest combo on ties
+        heap = []
+        for idx, combo, res in iter_results(window, survivors, max_lookahead, workers, backend, stats, positions):
+            row = (res["balance"], -idx, combo)
+            if len(heap) < keep:
+                heapq.heappush(heap, row)
+            elif row > heap[0]:
+                heapq.heapreplace(heap, row)
+        cost += bars * count
+        print(f"Halving: {count} combos on last {bars} bars -> keeping {len(heap)}")
+        survivors = sorted((-neg_idx, combo) for _, neg_idx, combo in heap)
+        count = len(survivors)
+    cost += n * count
+    saved = 100.0 * (1 - cost / (n * total)) if total else 0.0
+    print(f"Halving cost: {cost} bar-combos vs {n * total} for the full grid (saved {saved:.1f}%)\n")
+    return list(survivors)
+
+# -----------------------------
+# Budgeted random / model-guided search
+# -----------------------------
+# Samples the parameter space instead of walking a fixed grid, stopping at an
+# evaluation or wall-clock budget. Every point lives in the unit cube: integer
+# parameters map linearly, SL/TP log-uniformly. "random" samples uniformly;
+# "bayes" is a small tree-structured Parzen estimator that, after a random
+# warm-up, proposes points where the density of the best quarter of results
+# is high relative to the rest. Same seed + same evaluation budget => same run.
+SEARCH_SPACE = {
+    "ema_fast": (3, 20),
+    "ema_slow": (15, 100),
+    "rsi_period": (5, 28),
+    "rsi_buy": (25, 60),
+    "rsi_sell": (40, 75),
+}
+SL_TP_SPACE = {
+    "FX": {"sl": (0.0003, 0.003), "tp": (0.0005, 0.005)},
+    "CRYPTO": {"sl": (0.002, 0.02), "tp": (0.004, 0.04)},
+}
+
+def search_space(asset_type, spec=None):
+    # asset types without built-in SL/TP bounds take the span of the grid
+    # spec's SL/TP values for that type
+    space = dict(SEARCH_SPACE)
+    if asset_type in SL_TP_SPACE:
+        space.update(SL_TP_SPACE[asset_type])
+        return space
+    values = dict((spec or DEFAULT_GRID).get("overrides", {}).get(asset_type, {}))
+    for name in ("sl", "tp"):
+        span = expand_values(values[name]) if name in values else []
+        if not span or min(span) <= 0:
+            raise ValueError(f"no {name.upper()} bounds for asset type {asset_type}: add positive "
+                             f"\"{name}\" values to its grid spec overrides")
+        space[name] = (float(min(span)), float(max(span)))
+    return space
+
+def decode_point(u, space):
+    combo = []
+    for value, name in zip(u, COMBO_PARAMS):
+        lo, hi = space[name]
+        if isinstance(lo, int):
+            combo.append(int(min(hi, lo + math.floor(value * (hi - lo + 1)))))
+        else:
+            combo.append(float(f"{lo * (hi / lo) ** value:.3g}"))
+    return tuple(combo)
+
+def _kde_log_density(x, points, bandwidth):
+    d2 = ((x[:, None, :] - points[None, :, :]) ** 2).sum(axis=-1) / (2 * bandwidth ** 2)
+    low = d2.min(axis=1)
+    return -low + np.log(np.exp(-(d2 - low[:, None])).sum(axis=1)) - np.log(len(points))
+
+def _propose(rng, points, scores, n_candidates=64, gamma=0.25):
+    order = np.argsort(-scores, kind="stable")
+    n_good = max(1, int(math.ceil(gamma * len(points))))
+    good, bad = points[order[:n_good]], points[order[n_good:]]
+    bandwidth = max(0.05, len(points) ** (-1.0 / (points.shape[1] + 4)) * 0.5)
+    centers = good[rng.integers(0, n_good, n_candidates)]
+    cand = np.clip(centers + rng.normal(0.0, bandwidth, centers.shape), 0.0, 1.0 - 1e-12)
+    score = _kde_log_density(cand, good, bandwidth)
+    if len(bad):
+        score = score - _kde_log_density(cand, bad, bandwidth)
+    return cand[int(np.argmax(score))]
+
+def budgeted_search(df, space, strategy="random", seed=0, max_evals=500, max_seconds=None,
+                    max_lookahead=300, backend="numpy", batch_size=8, warmup=32, stats=None, positions=None,
+                    metrics=False):
+    rng = np.random.default_rng(seed)
+    data = ohlc_arrays(df)
+    outcome_tables = {}
+    dedup = new_dedup()
+    seen = set()
+    points, scores = [], []
+    start = time.time()
+    idx = 0
+    while idx < max_evals and (max_seconds is None or time.time() - start < max_seconds):
+        batch, units = [], []
+        for _ in range(100 * batch_size):
+            if len(batch) >= min(batch_size, max_evals - idx):
+                break
+            if strategy == "bayes" and len(points) >= warmup:
+                u = _propose(rng, np.array(points), np.array(scores))
+            else:
+                u = rng.random(len(COMBO_PARAMS))
+            combo = decode_point(u, space)
+            if combo[0] >= combo[1] or combo in seen:
+                continue
+            seen.add(combo)
+            batch.append(combo)
+            units.append(u)
+        if not batch:
+            break  # the space is exhausted
+        results = score_combos(data, batch, max_lookahead, outcome_tables, backend, dedup, positions=positions,
+                               metrics=metrics)
+        for combo, u, res, fresh in zip(batch, units, results, fresh_flags(dedup, len(batch))):
+            _count_dedup(stats, fresh)
+            idx += 1
+            points.append(u)
+            scores.append(res["balance"])
+            yield idx, combo, res
+
+# -----------------------------
+# Incremental re-optimization
+# -----------------------------
+# autoupdate.sh downloads the latest candles every cycle, but only a couple
+# of them are new. The state file keeps each combo's signal on every window
+# bar and its running wins/losses, the per-(SL, TP) outcomes and unresolved
+# trades, and the EMA tail values. A run only processes the bars that
+# arrived since the previous one and retires the bars that slid out of the
+# window, so its cost follows the new data.
+# Differences from a fresh run on the same window: indicators keep running
+# over the whole stream instead of restarting at the window start, and the
+# newest candle (still forming on the server) is held back until the next
+# download confirms it. Any mismatch (other grid, lookahead, symbol, or no
+# overlap with the stored bars) rebuilds the state from scratch.
+def _tally(state, q, side, slots, codes, sign):
+    # add (sign=1) or remove (sign=-1) resolved trades for every combo that
+    # signalled them: same (SL, TP) row and a signal of the trade's side
+    if len(q) == 0:
+        return
+    side_code = np.where(side == 0, 1, -1)
+    hit = (state["q_row"][:, None] == q[None, :]) & (state["sig"][:, slots] == side_code[None, :])
+    state["wins"] += sign * (hit & (codes == WIN)[None, :]).sum(axis=1)
+    state["losses"] += sign * (hit & (codes == LOSS)[None, :]).sum(axis=1)
+
+def init_incremental_state(df, combos, max_lookahead=300):
+    openp, high, low, close = ohlc_arrays(df)
+    state = _combo_layout(combos)
+    W = len(close)
+    state["sig"] = _combo_signals(state, ema_matrix(close, state["spans"]), rsi_matrix(close, state["periods"]))
+    Q = len(state["sltp"])
+    state["codes"] = np.zeros((Q, 2, W), dtype=np.int8)
+    state["pending"] = np.zeros((Q, 2, W), dtype=bool)
+    entry_ok = np.zeros(W, dtype=bool)
+    entry_ok[:-1] = ~np.isnan(openp[1:]) & (openp[1:] != 0)
+    open_ended = np.ones(W, dtype=bool) if max_lookahead is None else np.arange(W) + max_lookahead > W - 1
+    for q, (sl, tp) in enumerate(state["sltp"]):
+        table = build_outcome_table(openp, high, low, sl, tp, max_lookahead)
+        for side, key in enumerate(("buy", "sell")):
+            state["codes"][q, side] = table[key]
+            state["pending"][q, side] = entry_ok & (table[key] == NO_TRADE) & open_ended
+    state["wins"] = np.zeros(len(combos), dtype=np.int64)
+    state["losses"] = np.zeros(len(combos), dtype=np.int64)
+    q, side, slots = np.nonzero(state["codes"])
+    _tally(state, q, side, slots, state["codes"][q, side, slots], 1)
+    state["ohlc"] = np.stack([openp, high, low, close]).astype(float)
+    state["ema"] = ema_matrix(close, state["spans"])[:, -1].copy()
+    state["next_bar"] = W
+    return state
+
+def advance_incremental_state(state, bar, max_lookahead=300):
+    # bar: (open, high, low, close) of the next candle
+    W = state["ohlc"].shape[1]
+    abs_idx = state["next_bar"]
+    slot = abs_idx % W
+    # retire the bar that slides out of the window (it owns this slot)
+    q, side = np.nonzero(state["codes"][:, :, slot])
+    _tally(state, q, side, np.full(len(q), slot), state["codes"][q, side, slot], -1)
+    state["codes"][:, :, slot] = NO_TRADE
+    state["pending"][:, :, slot] = False
+
+    openp, high, low, close = bar
+    state["ohlc"][:, slot] = bar
+    state["ema"] = _ema_pass(np.array([close]), state["spans"], init=state["ema"])[:, 0]
+    tail = (abs_idx - np.arange(min(W, int(state["periods"].max()) + 1))[::-1]) % W
+    rsi = _rsi_pass(state["ohlc"][3, tail], state["periods"].astype(int))[:, -1:]
+    state["sig"][:, slot] = _combo_signals(state, state["ema"][:, None], rsi)[:, 0]
+
+    # the previous bar's trade enters at this bar's open
+    if not np.isnan(openp) and openp != 0:
+        state["pending"][:, :, (abs_idx - 1) % W] = True
+
+    q, side, slots = np.nonzero(state["pending"])
+    age = (slot - slots) % W
+    if max_lookahead is not None:
+        expired = age > max_lookahead
+        state["pending"][q[expired], side[expired], slots[expired]] = False
+        q, side, slots = q[~expired], side[~expired], slots[~expired]
+    entry = state["ohlc"][0, (slots + 1) % W]
+    sl_pct, tp_pct = state["sltp"][q, 0], state["sltp"][q, 1]
+    buy = side == 0
+    sl_lvl = np.where(buy, entry * (1 - sl_pct), entry * (1 + sl_pct))
+    tp_lvl = np.where(buy, entry * (1 + tp_pct), entry * (1 - tp_pct))
+    tp_hit = np.where(buy, high >= tp_lvl, low <= tp_lvl)
+    sl_hit = np.where(buy, low <= sl_lvl, high >= sl_lvl)
+    done = tp_hit | sl_hit
+    q, side, slots = q[done], side[done], slots[done]
+    codes = np.where(sl_hit[done], LOSS, WIN).astype(np.int8)
+    state["codes"][q, side, slots] = codes
+    state["pending"][q, side, slots] = False
+    _tally(state, q, side, slots, codes, 1)
+    state["next_bar"] = abs_idx + 1
+
+_STATE_ARRAYS = ("combos", "spans", "periods", "sltp", "ef_row", "es_row", "rp_row", "q_row",
+                 "sig", "codes", "pending", "wins", "losses", "ohlc", "ema")
+
+def save_incremental_state(path, state, meta):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), next_bar=np.array(state["next_bar"]),
+                 **{key: state[key] for key in _STATE_ARRAYS})
+    os.replace(tmp, path)
+
+def load_incremental_state(path):
+    with np.load(path, allow_pickle=False) as payload:
+        state = {key: payload[key] for key in _STATE_ARRAYS}
+        state["next_bar"] = int(payload["next_bar"])
+        return state, json.loads(str(payload["meta"]))
+
+def incremental_scores(state, starting_balance=1000.0, risk_per_trade=20.0):
+    profit = win_pnl(state["combos"][:, 5], state["combos"][:, 6], risk_per_trade)
+    return float(starting_balance) + state["wins"] * profit - state["losses"] * risk_per_trade
+
+def run_incremental(df, combos, state_path, fingerprint, max_lookahead=300):
+    # returns (state, number of new bars, rebuilt?)
+    times = df["time"].astype(str).to_numpy()
+    bars = np.stack(ohlc_arrays(df)).astype(float)
+    confirmed = len(df) - 1  # the last candle may still be forming
+    state = meta = None
+    if os.path.exists(state_path):
+        try:
+            state, meta = load_incremental_state(state_path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Could not load incremental state {state_path}: {e}")
+    start = None
+    if meta is not None and meta["fingerprint"] == fingerprint:
+        hit = np.nonzero(times[:confirmed] == meta["last_time"])[0]
+        if hit.size and bars[3, hit[0]] == meta["last_close"] and confirmed - hit[0] - 1 <= state["ohlc"].shape[1]:
+            start = hit[0] + 1
+    if start is None:
+        window = df.iloc[:confirmed].reset_index(drop=True)
+        state = init_incremental_state(window, combos, max_lookahead)
+        new_bars, rebuilt = confirmed, True
+    else:
+        for i in range(start, confirmed):
+            advance_incremental_state(state, bars[:, i], max_lookahead)
+        new_bars, rebuilt = confirmed - start, False
+    meta = {"fingerprint": fingerprint, "last_time": str(times[confirmed - 1]),
+            "last_close": float(bars[3, confirmed - 1])}
+    save_incremental_state(state_path, state, meta)
+    return state, new_bars, rebuilt
+
+# -----------------------------
+# Out-of-core OHLC store
+# -----------------------------
+# Multi-year M1 histories do not fit in a DataFrame. --to-store appends
+# candle files to a directory of raw columns (time as int64 ns, OHLC as
+# float64 or --float32) that is memory-mapped, never loaded. Scoring a
+# store streams it in chunks, in two passes:
+#  1. per (SL, TP), trade outcomes for every bar, with still-open trades
+#     carried into the next chunk; cached in the store as int8 columns
+#  2. per chunk, the signals of a batch of combos, with EMA values carried
+#     across the boundary and RSI recomputed over a two-block overlap so its
+#     block-anchored sums are the same as on the whole series
+# On NaN-free data the results equal run_strategy on the full arrays.
+STORE_COLUMNS = ("open", "high", "low", "close")
+_STORE_BUDGET = 64 << 20  # bytes of combo x bar working arrays per chunk
+_STORE_BATCH = 8192  # combos scored per pass over the store
+
+def store_add_candles(path, symbol, timeframe, df, dtype="float64"):
+    # appends the rows newer than the store's last candle; returns how many
+    os.makedirs(path, exist_ok=True)
+    meta_path = os.path.join(path, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+    else:
+        meta = {"symbol": symbol, "timeframe": timeframe, "rows": 0, "dtype": dtype, "last_time": None}
+    times = df["time"].to_numpy().astype("datetime64[ns]").astype(np.int64)
+    keep = np.ones(len(df), dtype=bool) if meta["last_time"] is None else times > meta["last_time"]
+    if not keep.any():
+        return 0
+    columns = {"time": times[keep]}
+    for name in STORE_COLUMNS:
+        columns[name] = df[name].to_numpy(dtype=float)[keep].astype(meta["dtype"])
+    for name, values in columns.items():
+        with open(os.path.join(path, name + ".bin"), "ab") as f:
+            f.truncate(meta["rows"] * values.dtype.itemsize)  # drop rows of an interrupted append
+            f.write(values.tobytes())
+    meta["rows"] += int(keep.sum())
+    meta["last_time"] = int(columns["time"][-1])
+    write_json_atomic(meta_path, meta)
+    return int(keep.sum())
+
+def is_ohlc_store(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, "meta.json"))
+
+def open_ohlc_store(path):
+    with open(os.path.join(path, "meta.json"), "r") as f:
+        meta = json.load(f)
+    store = {"kind": "ohlc-store", "path": path, "meta": meta, "n": meta["rows"]}
+    for name in ("time",) + STORE_COLUMNS:
+        dtype = np.int64 if name == "time" else meta["dtype"]
+        store[name] = np.memmap(os.path.join(path, name + ".bin"), dtype=dtype, mode="r", shape=(meta["rows"],))
+    return store
+
+def _store_chunk_bars(n_combos, block, chunk_bars=None):
+    bars = chunk_bars or max(block, _STORE_BUDGET // (8 * max(1, n_combos)))
+    return max(block, bars // block * block)  # chunks start on RSI block boundaries
+
+def store_outcome_codes(store, sl_pct, tp_pct, max_lookahead=300, chunk_bars=1 << 16):
+    # int8 (2 x n) BUY/SELL outcome codes, built once and kept in the store
+    n = store["n"]
+    name = f"outcomes-{n}-{float(sl_pct)!r}-{float(tp_pct)!r}-{max_lookahead}.bin"
+    path = os.path.join(store["path"], name)
+    if os.path.exists(path):
+        return np.memmap(path, dtype=np.int8, mode="r", shape=(2, n))
+    tmp = f"{path}.{os.getpid()}.tmp"
+    codes = np.memmap(tmp, dtype=np.int8, mode="w+", shape=(2, max(n, 1)))[:, :n]
+    # open trades: bar, side (0 = BUY), TP level, SL level, last bar allowed
+    pending = [np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int8), np.zeros(0), np.zeros(0),
+               np.zeros(0, dtype=np.int64)]
+    for s in range(0, n, chunk_bars):
+        e = min(n, s + chunk_bars)
+        openp = np.asarray(store["open"][s:min(n, e + 1)], dtype=float)
+        high = np.asarray(store["high"][s:e], dtype=float)
+        low = np.asarray(store["low"][s:e], dtype=float)
+        # trades entered at open[i+1] for the bars of this chunk
+        entry = openp[1:]
+        bars = s + np.nonzero(~np.isnan(entry) & (entry != 0))[0]
+        entry = openp[bars - s + 1]
+        last = np.full(len(bars), n - 1) if max_lookahead is None else np.minimum(n - 1, bars + max_lookahead)
+        new = [np.concatenate([bars, bars]), np.repeat(np.array([0, 1], dtype=np.int8), len(bars)),
+               np.concatenate([entry * (1 + tp_pct), entry * (1 - tp_pct)]),
+               np.concatenate([entry * (1 - sl_pct), entry * (1 + sl_pct)]), np.concatenate([last, last])]
+        bar, side, tp_lvl, sl_lvl, last = [np.concatenate([p, q]) for p, q in zip(pending, new)]
+        start = np.maximum(bar + 1, s) - s
+        stop = np.minimum(last, e - 1) + 1 - s
+        stop = np.maximum(stop, start)
+        done, win, _ = first_exits(extremum_tables(high, low), start, stop, tp_lvl, sl_lvl, side == 0)
+        codes[side[done], bar[done]] = np.where(win[done], WIN, LOSS)
+        carry = ~done & (last >= e)
+        pending = [col[carry] for col in (bar, side, tp_lvl, sl_lvl, last)]
+    codes.flush()
+    del codes
+    os.replace(tmp, path)
+    return np.memmap(path, dtype=np.int8, mode="r", shape=(2, n))
+
+def _store_signal_chunks(store, layout, chunk_bars, block):
+    # yields (start, stop, int8 signals combo x bar) chunk by chunk
+    n = store["n"]
+    periods = layout["periods"].astype(int)
+    ema_state = None
+    for s in range(0, n, chunk_bars):
+        e = min(n, s + chunk_bars)
+        close = np.asarray(store["close"][s:e], dtype=float)
+        ema = _ema_pass(close, layout["spans"], init=ema_state)
+        ema_state = ema[:, -1]
+        lo = max(0, s - 2 * block)  # overlap keeps the RSI block anchoring of the whole series
+        rsi = _rsi_pass(np.asarray(store["close"][lo:e], dtype=float), periods)[:, s - lo:]
+        yield s, e, _combo_signals(layout, ema, rsi)
+
+def score_store(store, combos, max_lookahead=300, chunk_bars=None, starting_balance=1000.0,
+                risk_per_trade=20.0):
+    if isinstance(store, str):
+        store = open_ohlc_store(store)
+    results = []
+    for b in range(0, len(combos), _STORE_BATCH):
+        batch = combos[b:b + _STORE_BATCH]
+        layout = _combo_layout(batch)
+        block = max(RSI_BLOCK, int(layout["periods"].max()))
+        bars = _store_chunk_bars(len(batch), block, chunk_bars)
+        tables = [store_outcome_codes(store, sl, tp, max_lookahead) for sl, tp in layout["sltp"]]
+        wins = np.zeros(len(batch), dtype=np.int64)
+        losses = np.zeros(len(batch), dtype=np.int64)
+        for s, e, sig in _store_signal_chunks(store, layout, bars, block):
+            buy_bits, sell_bits = pack_bits(sig == 1), pack_bits(sig == -1)
+            for q, table in enumerate(tables):
+                rows = np.nonzero(layout["q_row"] == q)[0]
+                w, l = score_bits(buy_bits[rows], sell_bits[rows], {"buy": table[0, s:e], "sell": table[1, s:e]})
+                wins[rows] += w
+                losses[rows] += l
+        for combo, w, l in zip(batch, wins, losses):
+            results.append(strategy_result(int(w), int(l), combo[5], combo[6], starting_balance, risk_per_trade))
+    return results
+
+# options main_store honours; main warns about any other one that is set
+STORE_OPTIONS = ("max_lookahead", "grid", "out", "shard", "top_k", "results_dir", "checkpoint_every")
+
+def main_store(path, max_lookahead=300, grid=None, chunk_bars=None, out="strategy.json", report=None, shard=None,
+               top_k=10, results_dir=None):
+    # the grid is streamed through score_store one batch at a time, so
+    # neither the combos nor their results are ever held as a whole
+    spec = load_grid_spec(grid) if isinstance(grid, str) or grid is None else grid
+    store = open_ohlc_store(path)
+    symbol, timeframe = store["meta"]["symbol"], store["meta"]["timeframe"]
+    asset_type = detect_asset_type(symbol, spec)
+    print(f"Memory-mapped {store['n']} candles from {path} (symbol={symbol}, timeframe={timeframe}, "
+          f"type={asset_type}, {store['meta']['dtype']})")
+    ranges, constraints = grid_ranges(asset_type, spec), spec.get("constraints", [])
+    total = grid_size(ranges, constraints, shard)
+    print(f"Total parameter sets to test: {total}, streamed in chunks\n")
+    if shard:
+        print(f"Shard {shard[0]}/{shard[1]} of {grid_size(ranges, constraints)} combos")
+    board = new_leaderboard(top_k)
+    results = open_results_store(results_dir, {"symbol": symbol, "timeframe": timeframe, "search": "grid",
+                                               "max_lookahead": max_lookahead}) if results_dir else None
+    start = time.time()
+    best, best_idx, done = {"balance": -1e18}, None, 0
+    for chunk in iter_chunks(iter_grid(ranges, constraints, shard), _STORE_BATCH):
+        scores = score_store(store, [combo for _, combo in chunk], max_lookahead, chunk_bars)
+        for (idx, combo), res in zip(chunk, scores):
+            leaderboard_push(board, idx, combo, res)
+            if results:
+                store_append(results, idx, combo, res)
+            if res["balance"] > best["balance"]:
+                best, best_idx = strategy_entry(combo, res, symbol), idx
+        done += len(chunk)
+        print(f"Checked {done}/{total} combos... elapsed={time.time() - start:.1f}s")
+    print(f"Scored {done} combos in {time.time() - start:.1f}s, best #{best_idx}")
+    print(f"\nTop {top_k} by balance:")
+    for row in leaderboard_rows(board, "balance"):
+        print(f"  #{row['idx']} ${row['balance']:.2f} winrate={row['winrate']:.2f}% trades={row['trades']} "
+              f"{dict((name, row[name]) for name in COMBO_PARAMS)}")
+    if results:
+        close_results_store(results, board)
+        print(f"Saved {results['rows']} results => {results_dir} (re-rank with --query {results_dir})")
+    if shard and best_idx is not None:
+        best.update(idx=best_idx, shard=f"{shard[0]}/{shard[1]}")
+    if report is not None:
+        report.update(symbol=symbol, timeframe=timeframe, asset_type=asset_type, combos=done, total=total,
+                      bars=store["n"], leaderboard=leaderboard_rows(board, "balance"))
+    if out:
+        save_strategy(best, out)
+    return best
+
+# -----------------------------
+# Walk-forward optimization
+# -----------------------------
+# Slide a train window and the test window right after it across the
+# history: the best combo on each train window is scored out of sample on
+# its test window. Indicators, signals and outcome tables are computed once
+# for the whole series. A trade on bar i that closes on bar e counts for
+# every window with lo <= i and e < hi, a contiguous run of window indices,
+# so all train windows are scored together with one difference array per
+# (SL, TP) instead of re-running each window.
+def parse_walk_forward(value):
+    parts = [int(p) for p in value.split(":")]
+    if len(parts) not in (2, 3) or min(parts) <= 0:
+        raise argparse.ArgumentTypeError("expected TRAIN:TEST[:STEP] bar counts, e.g. 300:60")
+    return tuple(parts) if len(parts) == 3 else (parts[0], parts[1], parts[1])
+
+def window_counts(layout, sig, tables, first, step, count, length):
+    # wins/losses (count x combos) for windows [first + k*step, ... + length)
+    n_combos = len(layout["combos"])
+    wins = np.zeros((count + 1, n_combos), dtype=np.int64)
+    losses = np.zeros((count + 1, n_combos), dtype=np.int64)
+    for q, table in enumerate(tables):
+        rows = np.nonzero(layout["q_row"] == q)[0]
+        for key, side_code in (("buy", 1), ("sell", -1)):
+            bars = np.nonzero(table[key])[0]
+            exits = table[key + "_exit"][bars]
+            k_first = np.maximum(0, (exits - length - first) // step + 1)
+            k_last = np.minimum(count - 1, (bars - first) // step)
+            ok = (k_first <= k_last) & (bars >= first)
+            bars, k_first, k_last = bars[ok], k_first[ok], k_last[ok]
+            hit = (sig[np.ix_(rows, bars)] == side_code).T
+            win = table[key][bars] == WIN
+            for counts, mask in ((wins, win), (losses, ~win)):
+                contrib = (hit & mask[:, None]).astype(np.int64)
+                add = np.zeros((count + 1, len(rows)), dtype=np.int64)
+                np.add.at(add, k_first, contrib)
+                np.add.at(add, k_last + 1, -contrib)
+                counts[:, rows] += add
+    return np.cumsum(wins, axis=0)[:count], np.cumsum(losses, axis=0)[:count]
+
+def walk_forward(df, combos, train, test, step=None, max_lookahead=300,
+                 starting_balance=1000.0, risk_per_trade=20.0):
+    step = step or test
+    data = ohlc_arrays(df)
+    openp, high, low, close = data
+    n = len(close)
+    count = (n - train - test) // step + 1 if n >= train + test else 0
+    if count <= 0:
+        return []
+    layout = _combo_layout(combos)
+    sig = _combo_signals(layout, ema_matrix(close, layout["spans"]), rsi_matrix(close, layout["periods"]))
+    tables = [cached_outcome_table(openp, high, low, sl, tp, max_lookahead) for sl, tp in layout["sltp"]]
+    wins, losses = window_counts(layout, sig, tables, 0, step, count, train)
+    profit = win_pnl(layout["combos"][:, 5], layout["combos"][:, 6], risk_per_trade)
+    balances = float(starting_balance) + wins * profit - losses * risk_per_trade
+    best = np.argmax(balances, axis=1)  # first maximum = earliest combo on ties
+
+    times = df["time"].astype(str).to_numpy() if isinstance(df, pd.DataFrame) and "time" in df else None
+    windows = []
+    for k in range(count):
+        lo = k * step
+        mid, hi = lo + train, lo + train + test
+        c = int(best[k])
+        combo = combos[c]
+        train_res = strategy_result(int(wins[k, c]), int(losses[k, c]), combo[5], combo[6],
+                                    starting_balance, risk_per_trade)
+        test_res = run_strategy(data, *combo, starting_balance=starting_balance, risk_per_trade=risk_per_trade,
+                                max_lookahead=max_lookahead, outcomes=tables[layout["q_row"][c]],
+                                window=(mid, hi))
+        row = {"window": k, "train": [lo, mid], "test": [mid, hi],
+               "params": dict(zip(COMBO_PARAMS, combo)), "train_result": train_res, "test_result": test_res}
+        if times is not None:
+            row["test_time"] = [times[mid], times[hi - 1]]
+        windows.append(row)
+    return windows
+
+def walk_forward_summary(windows, starting_balance=1000.0):
+    wins = sum(w["test_result"]["wins"] for w in windows)
+    losses = sum(w["test_result"]["losses"] for w in windows)
+    pnl = [w["test_result"]["balance"] - starting_balance for w in windows]
+    train_pnl = [w["train_result"]["balance"] - starting_balance for w in windows]
+    return {"windows": len(windows), "oos_pnl": float(sum(pnl)), "oos_trades": wins + losses,
+            "oos_winrate": wins / (wins + losses) * 100.0 if wins + losses else 0.0,
+            "profitable_windows": sum(p > 0 for p in pnl),
+            "mean_train_pnl": float(np.mean(train_pnl)) if windows else 0.0,
+            "mean_test_pnl": float(np.mean(pnl)) if windows else 0.0}
+
+def main_walk_forward(path, spec_wf, max_lookahead=300, grid=None, out="walkforward.json"):
+    train, test, step = spec_wf
+    spec = load_grid_spec(grid) if isinstance(grid, str) or grid is None else grid
     symbol, timeframe, df = load_mt5_json(path)
-    asset_type = detect_asset_type(symbol)
+    asset_type = detect_asset_type(symbol, spec)
     print(f"Loaded {len(df)} candles from {path} (symbol={symbol}, timeframe={timeframe}, type={asset_type})")
+    combos = [combo for _, combo in iter_grid(grid_ranges(asset_type, spec), spec.get("constraints", []))]
+    start = time.time()
+    windows = walk_forward(df, combos, train, test, step, max_lookahead)
+    print(f"Walk-forward: {len(windows)} windows (train={train}, test={test}, step={step}) x {len(combos)} combos "
+          f"in {time.time() - start:.2f}s")
+    for w in windows:
+        tr, te = w["train_result"], w["test_result"]
+        print(f"[{w['window']}] train {w['train'][0]}-{w['train'][1]} ${tr['balance']:.2f} ({tr['trades']} trades) "
+              f"=> test {w['test'][0]}-{w['test'][1]} ${te['balance']:.2f} "
+              f"({te['trades']} trades, {te['winrate']:.1f}%) {w['params']}")
+    summary = walk_forward_summary(windows)
+    print(f"\nOut of sample: {summary}")
+    with open(out, "w") as f:
+        json.dump({"symbol": symbol, "train": train, "test": test, "step": step,
+                   "max_lookahead": max_lookahead, "summary": summary, "windows": windows}, f, indent=2)
+    print(f"Saved walk-forward report => {out}")
+    return summary
+
+# -----------------------------
+# Results store and leaderboard
+# -----------------------------
+# Every scored combo can be streamed to a columnar store: one raw
+# little-endian file per column plus meta.json with the row count, so a
+# re-rank only reads the columns it needs (memory-mapped) and never
+# re-simulates. The leaderboard keeps a bounded top-K heap per metric while
+# the search runs; ties go to the earliest combo, like the best strategy.
+RESULT_COLUMNS = (("idx", "<i8"),) + tuple((name, "<f8") for name in COMBO_PARAMS) + (
+    ("balance", "<f8"), ("wins", "<i8"), ("losses", "<i8"), ("trades", "<i8"), ("winrate", "<f8"),
+    ("max_drawdown", "<f8"), ("profit_factor", "<f8"), ("expectancy", "<f8"))  # NaN unless --metrics
+LEADERBOARD_METRICS = ("balance", "winrate", "wins", "trades")
+_STORE_FLUSH_ROWS = 4096
+
+def open_results_store(path, info=None, rows=0):
+    # rows > 0 reopens a checkpointed store and drops anything written after it
+    os.makedirs(path, exist_ok=True)
+    files = {}
+    for name, dtype in RESULT_COLUMNS:
+        f = open(os.path.join(path, name + ".bin"), "ab" if rows else "wb")
+        f.truncate(rows * np.dtype(dtype).itemsize)
+        files[name] = f
+    return {"path": path, "files": files, "buffer": [], "rows": rows, "info": info or {}}
+
+def store_append(store, idx, combo, res):
+    store["buffer"].append((idx,) + tuple(combo) + tuple(res.get(name, np.nan) for name, _ in RESULT_COLUMNS[8:]))
+    if len(store["buffer"]) >= _STORE_FLUSH_ROWS:
+        store_flush(store)
+
+def store_flush(store):
+    if not store["buffer"]:
+        return
+    columns = list(zip(*store["buffer"]))
+    for (name, dtype), values in zip(RESULT_COLUMNS, columns):
+        f = store["files"][name]
+        f.write(np.asarray(values, dtype=dtype).tobytes())
+        f.flush()  # a checkpoint may record these rows next
+    store["rows"] += len(store["buffer"])
+    store["buffer"] = []
+
+def close_results_store(store, leaderboard=None):
+    store_flush(store)
+    for f in store["files"].values():
+        f.close()
+    meta = {"rows": store["rows"], "columns": [list(col) for col in RESULT_COLUMNS], "info": store["info"]}
+    write_json_atomic(os.path.join(store["path"], "meta.json"), meta)
+    if leaderboard is not None:
+        write_json_atomic(os.path.join(store["path"], "leaderboard.json"),
+                          {metric: leaderboard_rows(leaderboard, metric) for metric in leaderboard["heaps"]})
+
+def load_results(path, columns=None):
+    with open(os.path.join(path, "meta.json"), "r") as f:
+        meta = json.load(f)
+    out = {}
+    for name, dtype in meta["columns"]:
+        if columns is None or name in columns:
+            file = os.path.join(path, name + ".bin")
+            out[name] = (np.memmap(file, dtype=dtype, mode="r", shape=(meta["rows"],)) if meta["rows"]
+                         else np.zeros(0, dtype=dtype))
+    return meta, out
+
+def query_results(path, rank_by="balance", top=10, where=(), ascending=False):
+    meta, _ = load_results(path, ())
+    names = [name for name, _ in meta["columns"]]  # stores written before a column was added lack it
+    if rank_by not in names:
+        raise ValueError(f"unknown metric {rank_by!r}, expected one of {names}")
+    parsed = [parse_constraint(w, names) for w in where]
+    needed = {rank_by, "idx"} | {x for a, _, b in parsed for x in (a, b) if isinstance(x, str)}
+    meta, cols = load_results(path, needed)
+    keep = np.ones(meta["rows"], dtype=bool)
+    for a, op, b in parsed:
+        keep &= op(cols[a] if isinstance(a, str) else a, cols[b] if isinstance(b, str) else b)
+    rows = np.nonzero(keep)[0]
+    metric = np.asarray(cols[rank_by][rows], dtype=float)
+    order = np.lexsort((cols["idx"][rows], metric if ascending else -metric))[:top]
+    _, full = load_results(path)
+    return [{name: full[name][rows[i]].item() for name in names} for i in order]
+
+def new_leaderboard(k=10, metrics=LEADERBOARD_METRICS):
+    return {"k": k, "heaps": {metric: [] for metric in metrics}}
+
+def leaderboard_push(board, idx, combo, res):
+    for metric, heap in board["heaps"].items():
+        row = (res[metric], -idx, idx, combo, res)
+        if len(heap) < board["k"]:
+            heapq.heappush(heap, row)
+        elif row[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, row)
+
+def leaderboard_state(board):
+    return {"k": board["k"], "heaps": {metric: [[idx, list(combo), res] for _, _, idx, combo, res in heap]
+                                       for metric, heap in board["heaps"].items()}}
+
+def leaderboard_from_state(state):
+    board = new_leaderboard(state["k"], list(state["heaps"]))
+    for metric, rows in state["heaps"].items():
+        board["heaps"][metric] = [(res[metric], -idx, idx, tuple(combo), res) for idx, combo, res in rows]
+        heapq.heapify(board["heaps"][metric])
+    return board
+
+def leaderboard_rows(board, metric):
+    rows = sorted(board["heaps"][metric], key=lambda row: row[:2], reverse=True)
+    return [dict(zip(COMBO_PARAMS, combo), idx=idx, **res) for _, _, idx, combo, res in rows]
+
+# -----------------------------
+# Monte Carlo robustness
+# -----------------------------
+# The top balance on a short history is often a handful of lucky trades. The
+# top-K combos' trade sequences are resampled many times (bootstrap: draw
+# trades with replacement; permute: same trades, shuffled order) as one
+# batch of (candidate x simulation) equity paths, giving percentile balances
+# and drawdowns. Ranking by a low percentile prefers combos whose result
+# survives reshuffling over one spike.
+MC_PERCENTILES = (5, 50, 95)
+_MC_BUDGET = 64 << 20  # bytes of equity paths per batch
 
-    # parameter ranges
-    ema_fast_range = [5, 9, 12]
-    ema_slow_range = [21, 30, 50]
-    rsi_period_range = [7, 14]
-    rsi_buy_range = [40, 45, 50]
-    rsi_sell_range = [50, 55, 60]
+def monte_carlo(pnl_rows, simulations=1000, method="bootstrap", seed=0, starting_balance=1000.0):
+    # pnl_rows: per candidate, its trades' P&L in order -> final balances and
+    # max drawdowns, both (candidate x simulation)
+    counts = np.array([len(p) for p in pnl_rows], dtype=np.int64)
+    width = max(1, int(counts.max())) if len(counts) else 1
+    pnl = np.zeros((len(pnl_rows), width))
+    for k, p in enumerate(pnl_rows):
+        pnl[k, :len(p)] = p
+    rng = np.random.default_rng(seed)
+    total = len(pnl_rows) * simulations
+    balances = np.empty(total)
+    drawdowns = np.empty(total)
+    step = max(1, _MC_BUDGET // (24 * width))
+    for lo in range(0, total, step):
+        cand = np.arange(lo, min(total, lo + step)) // simulations
+        if method == "bootstrap":
+            # padding past a candidate's trade count stays zero
+            pick = rng.integers(0, np.maximum(counts[cand], 1)[:, None], (len(cand), width))
+            paths = pnl[cand[:, None], pick] * (np.arange(width) < counts[cand, None])
+        else:
+            paths = rng.permuted(pnl[cand], axis=1)
+        equity = starting_balance + np.cumsum(paths, axis=1)
+        peak = np.maximum(np.maximum.accumulate(equity, axis=1), starting_balance)
+        balances[lo:lo + len(cand)] = equity[:, -1]
+        drawdowns[lo:lo + len(cand)] = (peak - equity).max(axis=1)
+    return balances.reshape(-1, simulations), drawdowns.reshape(-1, simulations)
+
+def robustness(data, rows, simulations=1000, method="bootstrap", seed=0, rank_pct=None, max_lookahead=300,
+               positions=None, starting_balance=1000.0, risk_per_trade=20.0):
+    # rows: leaderboard rows; returns them with percentile stats added,
+    # re-ranked by the rank_pct-th percentile balance when given
+    if not rows:
+        return []
+    combos = [tuple(row[name] for name in COMBO_PARAMS) for row in rows]
+    ledger = trade_ledger(data, combos, max_lookahead, positions, risk_per_trade)
+    # resampled in entry order, the order the strategy takes them
+    order = np.lexsort((ledger["entry"], ledger["combo"]))
+    pnl_rows = np.split(ledger["pnl"][order], np.cumsum(np.bincount(ledger["combo"], minlength=len(combos)))[:-1])
+    balances, drawdowns = monte_carlo(pnl_rows, simulations, method, seed, starting_balance)
+    pcts = sorted(set(MC_PERCENTILES) | ({rank_pct} if rank_pct is not None else set()))
+    out = []
+    for row, bal, dd in zip(rows, balances, drawdowns):
+        stats = {f"balance_p{p:g}": float(v) for p, v in zip(pcts, np.percentile(bal, pcts))}
+        stats.update({f"drawdown_p{p:g}": float(v) for p, v in zip((50, 95), np.percentile(dd, (50, 95)))})
+        out.append(dict(row, **stats))
+    if rank_pct is not None:
+        key = f"balance_p{rank_pct:g}"
+        out.sort(key=lambda row: (-row[key], -row["balance"], row["idx"]))
+    return out
+
+# -----------------------------
+# Parameter surface
+# -----------------------------
+# The grid is a product of per-parameter value lists, so its results fill a
+# dense tensor with one axis per COMBO_PARAMS entry (NaN where a constraint
+# excludes a combo or nothing was scored). Box filters over each cell's
+# neighbours -- one step either way along every axis -- score how stable
+# the surface is around it: "mean" smooths the balance, "min" takes the worst
+# neighbour. Both are separable, so a filter is a few shifted reductions per
+# axis. A combo on a broad plateau then beats an isolated spike. Axes too
+# short for the window (at most 2 * radius values) would give every cell
+# along them the same score, so they are left out of the filter; equal
+# scores go to the higher own balance.
+PLATEAU_FILTERS = ("mean", "min")
 
-    if asset_type == "FX":
-        sl_range = [0.0005, 0.001]   # 0.05%–0.1%
-        tp_range = [0.001, 0.002]    # 0.1%–0.2%
+def new_surface(ranges):
+    axes = [list(ranges[name]) for name in COMBO_PARAMS]
+    return {"axes": axes, "lookup": [{v: i for i, v in enumerate(values)} for values in axes],
+            "balance": np.full([len(values) for values in axes], np.nan)}
+
+def surface_add(surface, combo, value):
+    surface["balance"][tuple(lookup[v] for lookup, v in zip(surface["lookup"], combo))] = value
+
+def _box_reduce(tensor, reduce, fill, radius=1):
+    # reduce over +-radius cells along every axis in turn; fill pads the edges
+    out = tensor
+    for axis in range(tensor.ndim):
+        if tensor.shape[axis] <= 2 * radius:
+            continue  # the window spans the whole axis, see above
+        pad = [(0, 0)] * tensor.ndim
+        pad[axis] = (radius, radius)
+        padded = np.pad(out, pad, constant_values=fill)
+        n = out.shape[axis]
+        shifted = [np.take(padded, np.arange(k, k + n), axis=axis) for k in range(2 * radius + 1)]
+        out = functools.reduce(reduce, shifted)
+    return out
+
+def plateau_scores(tensor, method="mean", radius=1):
+    # NaN cells never count as neighbours and keep a NaN score
+    scored = ~np.isnan(tensor)
+    if method == "min":
+        out = _box_reduce(tensor, np.fmin, np.nan, radius)
     else:
-        sl_range = [0.005, 0.01]     # 0.5%–1%
-        tp_range = [0.01, 0.02]      # 1%–2%
+        total = _box_reduce(np.where(scored, tensor, 0.0), np.add, 0.0, radius)
+        count = _box_reduce(scored.astype(float), np.add, 0.0, radius)
+        out = total / np.maximum(count, 1)
+    return np.where(scored, out, np.nan)
 
-    all_combos = [(ef, es, rp, rb, rs, sl, tp) for ef in ema_fast_range for es in ema_slow_range
-                  for rp in rsi_period_range for rb in rsi_buy_range for rs in rsi_sell_range
-                  for sl in sl_range for tp in tp_range if ef < es]
-    total = len(all_combos)
-    print(f"Total parameter sets to test: {total} (SL/TP ranges auto-set for {asset_type})\n")
+def plateau_rows(surface, method="mean", radius=1, top=10):
+    # best cells by plateau score, then own balance, then grid order
+    scores = plateau_scores(surface["balance"], method, radius).ravel()
+    balance = surface["balance"].ravel()
+    cells = np.flatnonzero(~np.isnan(scores))
+    cells = cells[np.lexsort((cells, -balance[cells], -scores[cells]))][:top]
+    rows = []
+    for cell in cells:
+        pos = np.unravel_index(cell, surface["balance"].shape)
+        combo = tuple(axis[i] for axis, i in zip(surface["axes"], pos))
+        rows.append(dict(zip(COMBO_PARAMS, combo), plateau=float(scores[cell]),
+                         balance=float(surface["balance"][pos])))
+    return rows
 
-    best = {"balance": -1e18}
-    start = time.time()
-    for idx, (ef, es, rp, rb, rs, sl, tp) in enumerate(all_combos, start=1):
-        res = run_strategy(df, ef, es, rp, rb, rs, sl, tp, max_lookahead=max_lookahead)
-        if res["balance"] > best["balance"]:
-            best = {"balance": res["balance"], "ema_fast": ef, "ema_slow": es, "rsi_period": rp,
-                    "rsi_buy": rb, "rsi_sell": rs, "sl_pct": sl, "tp_pct": tp,
-                    "wins": res["wins"], "losses": res["losses"],
-                    "trades": res["trades"], "winrate": res["winrate"],
-                    "symbol": symbol}
-            print(f"[NEW BEST @ {idx}/{total}] Balance=${res['balance']:.2f}, WinRate={res['winrate']:.2f}%, Trades={res['trades']}")
-        if idx % 40 == 0 or idx == total:
-            elapsed = time.time() - start
-            print(f"Checked {idx}/{total} combos... elapsed={elapsed:.1f}s")
+# -----------------------------
+# Checkpoint / resume
+# -----------------------------
+# A checkpoint records how far the combo stream got, the best strategy, the
+# leaderboard, the dedup counters and the --results row count. Combos are
+# submitted in idx order, so "how far" is the highest idx below which every
+# submitted combo has finished, plus the few finished above it (parallel
+# chunks complete out of order). A resumed run skips all of those and its
+# final best / leaderboard / store are the same as an uninterrupted run.
+# The file is replaced atomically, so a kill mid-write keeps the previous one.
+CHECKPOINT_VERSION = 1
+
+def run_fingerprint(df, **options):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(np.stack(ohlc_arrays(df)), dtype=float).tobytes())
+    h.update(json.dumps(options, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+def load_checkpoint(path, fingerprint):
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            ckpt = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Ignoring unreadable checkpoint {path}: {e}")
+        return None
+    if ckpt.get("version") != CHECKPOINT_VERSION or ckpt.get("fingerprint") != fingerprint:
+        print(f"⚠️ Checkpoint {path} is for another data file or settings, starting over")
+        return None
+    return ckpt
+
+def new_progress(watermark=0, finished=()):
+    # submitted vs finished combo indices, to find the resume point
+    return {"watermark": watermark, "finished": set(finished), "submitted": collections.deque()}
 
+def track_progress(progress, items):
+    for idx, combo in items:
+        if idx <= progress["watermark"] or idx in progress["finished"]:
+            continue
+        progress["submitted"].append(idx)
+        yield idx, combo
+
+def finish_progress(progress, idx):
+    progress["finished"].add(idx)
+    submitted = progress["submitted"]
+    while submitted and submitted[0] in progress["finished"]:
+        progress["watermark"] = submitted.popleft()
+        progress["finished"].discard(progress["watermark"])
+
+# -----------------------------
+# Main bruteforce
+# -----------------------------
+def strategy_entry(combo, res, symbol):
+    ef, es, rp, rb, rs, sl, tp = combo
+    entry = {"balance": res["balance"], "ema_fast": ef, "ema_slow": es, "rsi_period": rp,
+            "rsi_buy": rb, "rsi_sell": rs, "sl_pct": sl, "tp_pct": tp,
+            "wins": res["wins"], "losses": res["losses"],
+            "trades": res["trades"], "winrate": res["winrate"],
+            "symbol": symbol}
+    for name in TRADE_METRICS:
+        if name in res:  # scored with metrics; no losses gives an infinite profit factor, saved as null
+            entry[name] = res[name] if math.isfinite(res[name]) else None
+    return entry
+
+def save_strategy(best, out="strategy.json"):
     print("\n✅ Best Strategy Found:")
     print(best)
+    write_json_atomic(out, best)
+    print(f"Saved best strategy => {out}")
 
-    # Save to strategy.json
-    with open("strategy.json", "w") as f:
-        json.dump(best, f, indent=2)
-    print("Saved best strategy => strategy.json")
+def merge_shards(paths, out="strategy.json"):
+    # best of several --shard k/N runs: highest balance, the lower grid idx on
+    # ties, exactly as a single full-grid run would pick it
+    best, seen = None, {}
+    for path in paths:
+        with open(path, "r") as f:
+            entry = json.load(f)
+        if "idx" not in entry or "shard" not in entry:
+            raise ValueError(f"{path} has no idx/shard, it was not written by a --shard run")
+        k, count = parse_shard(entry["shard"])
+        seen.setdefault(count, set()).add(k)
+        if best is None or (entry["balance"], -entry["idx"]) > (best["balance"], -best["idx"]):
+            best = entry
+    if best is None:
+        raise ValueError("no shard results to merge")
+    if len(seen) > 1:
+        print(f"⚠️ merging shards of different splits ({', '.join(f'N={count}' for count in sorted(seen))})")
+    for count, ks in sorted(seen.items()):
+        missing = sorted(set(range(1, count + 1)) - ks)
+        if missing:
+            print(f"⚠️ merged without shard(s) {', '.join(f'{k}/{count}' for k in missing)}")
+    print(f"Merged {len(paths)} shard results, best from shard {best['shard']} (#{best['idx']})")
+    if out:
+        save_strategy(best, out)
     return best
 
+def main_validate(path, strategy_path, max_lookahead=300, shards=1, positions=None):
+    # re-score a saved strategy on path, the history split across shards
+    with open(strategy_path, "r") as f:
+        saved = json.load(f)
+    params = tuple(saved[k] for k in ("ema_fast", "ema_slow", "rsi_period", "rsi_buy", "rsi_sell", "sl_pct", "tp_pct"))
+    symbol, timeframe, df = load_mt5_json(path)
+    print(f"Loaded {len(df)} candles from {path} (symbol={symbol}, timeframe={timeframe})")
+    start = time.time()
+    res = run_strategy(df, *params, max_lookahead=max_lookahead, shards=shards, positions=positions)
+    print(f"Validated {params} in {time.time() - start:.2f}s ({shards} shards)")
+    print(strategy_entry(params, res, symbol))
+    return res
+
+# options main_incremental honours; main warns about any other one that is set
+INCREMENTAL_OPTIONS = ("max_lookahead", "grid", "out", "incremental", "checkpoint_every")
+
+def main_incremental(path, state_path, max_lookahead=300, grid=None, out="strategy.json", report=None):
+    spec = load_grid_spec(grid) if isinstance(grid, str) or grid is None else grid
+    symbol, timeframe, df = load_mt5_json(path)
+    asset_type = detect_asset_type(symbol, spec)
+    print(f"Loaded {len(df)} candles from {path} (symbol={symbol}, timeframe={timeframe}, type={asset_type})")
+    ranges = grid_ranges(asset_type, spec)
+    combos = [combo for _, combo in iter_grid(ranges, spec.get("constraints", []))]
+    if len(df) - 1 < 2:
+        # the last candle may still be forming: too few confirmed bars to
+        # keep state on, score the file in full and leave the state alone
+        print(f"⚠️ {len(df)} candles are too few for --incremental, running the full search")
+        return main(path, max_lookahead, grid=spec, out=out, report=report)
+    fingerprint = hashlib.blake2b(json.dumps([symbol, asset_type, max_lookahead, ranges, spec.get("constraints", [])],
+                                             sort_keys=True).encode(), digest_size=16).hexdigest()
+    start = time.time()
+    state, new_bars, rebuilt = run_incremental(df, combos, state_path, fingerprint, max_lookahead)
+    how = "rebuilt state on" if rebuilt else "processed"
+    print(f"Incremental: {how} {new_bars} bars for {len(combos)} combos in {time.time() - start:.3f}s "
+          f"(window={state['ohlc'].shape[1]} bars)")
+
+    balances = incremental_scores(state)
+    k = int(np.argmax(balances))  # first maximum = earliest combo on ties
+    wins, losses = int(state["wins"][k]), int(state["losses"][k])
+    combo = combos[k]
+    best = strategy_entry(combo, strategy_result(wins, losses, combo[5], combo[6]), symbol)
+    if report is not None:
+        report.update(symbol=symbol, timeframe=timeframe, asset_type=asset_type, combos=len(combos),
+                      new_bars=new_bars, rebuilt=rebuilt)
+    if out:
+        save_strategy(best, out)
+    return best
+
+def main(path, max_lookahead=300, workers=1, backend="auto", search="grid", eta=3,
+         max_evals=500, max_seconds=None, seed=0, grid=None, shard=None, incremental=None,
+         out="strategy.json", top_k=10, results_dir=None, checkpoint=None, checkpoint_every=30.0, report=None,
+         positions=None, timeframes=None, timeframe=None, monte_carlo=0, mc_method="bootstrap", mc_rank=None,
+         metrics=False, ledger=None, plateau=None, plateau_radius=1):
+    # out=None only returns the best strategy (batch mode writes it itself);
+    # report: optional dict filled with run details for API callers.
+    # timeframes: search each of these (resampled from path), see
+    # main_timeframes; timeframe: the single one this call searches.
+    # monte_carlo: simulations per top-K combo (0 = off), see robustness.
+    # metrics: add TRADE_METRICS to every result; ledger: write the top-K
+    # combos' trade ledger (.npz) to this path. plateau: pick the best by a
+    # PLATEAU_FILTERS score of the grid's balance surface
+    options = {name: value for name, value in locals().items() if name in RUN_OPTIONS}
+    if incremental or is_ohlc_store(path):
+        # neither mode runs the in-memory search, name what it leaves out
+        ignored = ignored_options(options, INCREMENTAL_OPTIONS if incremental else STORE_OPTIONS)
+        if ignored:
+            print(f"⚠️ {'--incremental' if incremental else 'an OHLC store'} ignores "
+                  f"{', '.join(option_flag(name) for name in ignored)}")
+    if incremental:
+        return main_incremental(path, incremental, max_lookahead, grid, out, report)
+    if is_ohlc_store(path):
+        return main_store(path, max_lookahead, grid, out=out, report=report, shard=shard, top_k=top_k,
+                          results_dir=results_dir)
+    spec = load_grid_spec(grid) if isinstance(grid, str) or grid is None else grid
+    timeframes = timeframes or spec.get("timeframes")
+    if timeframes and timeframe is None:
+        return main_timeframes(path, report, **dict(options, grid=spec, timeframes=timeframes))
+    symbol, source_timeframe, df = load_mt5_json(path)
+    timeframe = timeframe or source_timeframe
+    df = resample_candles(df, source_timeframe, timeframe)
+    asset_type = detect_asset_type(symbol, spec)
+    print(f"Loaded {len(df)} candles from {path} (symbol={symbol}, timeframe={timeframe}, type={asset_type})")
+    # what the result depends on: keys both the result cache and checkpoints
+    settings = {name: value for name, value in options.items() if name not in RUN_ONLY_OPTIONS + ("grid",)}
+    settings.update(symbol=symbol, spec=spec)
+
+    # an identical candle file + settings reuses the stored result (--cache);
+    # runs that write files besides the strategy (--results, --ledger) or stop
+    # early always search
+    result_key = None
+    if _DISK_CACHE["dir"] and not (results_dir or ledger or checkpoint or max_seconds):
+        result_key = run_fingerprint(df, **settings)
+        hit = disk_load("result", result_key)
+        if hit is not None:
+            print(f"Cache hit: same candles and settings as a previous run ({_DISK_CACHE['dir']})")
+            if report is not None:
+                report.update(hit["details"], cached=True)
+            if out:
+                save_strategy(hit["best"], out)
+            return hit["best"]
+
+    backend = pick_backend(backend)
+    stats = {"combos": 0, "unique": 0}
+    rung_stats = {"combos": 0, "unique": 0}  # halving rungs: re-run on resume, so never checkpointed
+    ckpt = None
+    if checkpoint and search in ("random", "bayes"):
+        print(f"⚠️ --checkpoint only applies to grid/halving search, {search} runs without it")
+        checkpoint = None
+    if checkpoint:
+        fingerprint = run_fingerprint(df, **settings)
+        ckpt = load_checkpoint(checkpoint, fingerprint)
+        if ckpt:
+            print(f"Resuming from {checkpoint}: {ckpt['done']} combos already done")
+            stats.update(ckpt["stats"])
+    progress = new_progress(ckpt["watermark"], ckpt["finished"]) if ckpt else new_progress()
+    if positions is not None:
+        print(f"Position limit: {'one per side' if positions == 'side' else positions} open at a time")
+    if plateau and search != "grid":
+        print(f"⚠️ --plateau needs the full grid surface, {search} search picks by raw balance")
+        plateau = None
+    if plateau and shard:
+        print("⚠️ --plateau needs the full grid surface, a --shard run picks by raw balance (see --merge)")
+        plateau = None
+    surface = None
+    if search in ("random", "bayes"):
+        budget = f"{max_evals} evaluations" + (f" or {max_seconds}s" if max_seconds else "")
+        print(f"{search} search over {asset_type} ranges, budget {budget}, seed {seed}\n")
+        total = max_evals
+        results = budgeted_search(df, search_space(asset_type, spec), search, seed, max_evals, max_seconds,
+                                  max_lookahead, backend, stats=stats, positions=positions, metrics=metrics)
+    else:
+        ranges = grid_ranges(asset_type, spec)
+        constraints = spec.get("constraints", [])
+        total = grid_size(ranges, constraints, shard)
+        print(f"Total parameter sets to test: {total} (SL/TP ranges auto-set for {asset_type})\n")
+        if shard:
+            print(f"Shard {shard[0]}/{shard[1]} of {grid_size(ranges, constraints)} combos")
+        items = iter_grid(ranges, constraints, shard)
+        if plateau:
+            surface = new_surface(ranges)
+            if ckpt:
+                surface["balance"][:] = np.array(ckpt["surface"], dtype=float).reshape(surface["balance"].shape)
+
+        if workers > 1:
+            print(f"Scoring on {workers} worker processes ({backend} backend)")
+        if search == "halving":
+            items = successive_halving(df, items, total, max_lookahead, workers, backend, eta, stats=rung_stats,
+                                       positions=positions)
+            total = len(items)  # progress counts the final rung, not the grid
+        items = track_progress(progress, items)
+        if workers <= 1:
+            # indicators are shared by every combo, warm them in one batched pass
+            close = ohlc_arrays(df)[3]
+            ema_matrix(close, ranges["ema_fast"] + ranges["ema_slow"])
+            rsi_matrix(close, ranges["rsi_period"])
+        results = iter_results(df, items, max_lookahead, workers, backend, stats, positions, metrics)
+
+    best = ckpt["best"] if ckpt else {"balance": -1e18}
+    best_idx = ckpt["best_idx"] if ckpt else None
+    done = ckpt["done"] if ckpt else 0
+    board = leaderboard_from_state(ckpt["leaderboard"]) if ckpt else new_leaderboard(top_k)
+    store = open_results_store(results_dir, {"symbol": symbol, "timeframe": timeframe, "search": search,
+                                             "max_lookahead": max_lookahead},
+                               ckpt["store_rows"] if ckpt else 0) if results_dir else None
+
+    def save_progress():
+        if store:
+            store_flush(store)
+        write_json_atomic(checkpoint, {
+            "version": CHECKPOINT_VERSION, "fingerprint": fingerprint, "watermark": progress["watermark"],
+            "finished": sorted(progress["finished"]), "done": done, "best": best, "best_idx": best_idx,
+            "stats": stats, "leaderboard": leaderboard_state(board), "store_rows": store["rows"] if store else 0,
+            "surface": surface["balance"].ravel().tolist() if surface else None})
+
+    # progress is the position in what this run scores (the shard, the final
+    # rung, the evaluation budget); idx is the combo's global grid index
+    unit = "final-rung combos" if search == "halving" else "combos"
+    start = last_save = time.time()
+    for idx, combo, res in results:
+        done += 1
+        finish_progress(progress, idx)
+        leaderboard_push(board, idx, combo, res)
+        if surface:
+            surface_add(surface, combo, res["balance"])
+        if store:
+            store_append(store, idx, combo, res)
+        if res["balance"] > best["balance"] or (res["balance"] == best["balance"] and idx < best_idx):
+            best = strategy_entry(combo, res, symbol)
+            best_idx = idx
+            print(f"[NEW BEST @ {done}/{total}, #{idx}] Balance=${res['balance']:.2f}, WinRate={res['winrate']:.2f}%, Trades={res['trades']}")
+        if done % 40 == 0 or done == total:
+            elapsed = time.time() - start
+            print(f"Checked {done}/{total} {unit}... elapsed={elapsed:.1f}s")
+        if checkpoint and time.time() - last_save >= checkpoint_every:
+            save_progress()
+            last_save = time.time()
+    if checkpoint:
+        save_progress()
+    if done < total:
+        print(f"Stopped after {done} combos (budget reached)")
+    stats = {name: stats[name] + rung_stats[name] for name in stats}
+    if stats["combos"]:
+        print(f"Signal dedup: {stats['unique']} unique signal sets for {stats['combos']} scored combos "
+              f"({dedup_ratio(stats):.1%} reused)")
+    print(f"\nTop {top_k} by balance:")
+    for row in leaderboard_rows(board, "balance"):
+        extra = (f" drawdown=${row['max_drawdown']:.2f} pf={row['profit_factor']:.2f} "
+                 f"expectancy=${row['expectancy']:.2f}" if metrics else "")
+        print(f"  #{row['idx']} ${row['balance']:.2f} winrate={row['winrate']:.2f}% trades={row['trades']}{extra} "
+              f"{dict((name, row[name]) for name in COMBO_PARAMS)}")
+    if store:
+        close_results_store(store, board)
+        print(f"Saved {store['rows']} results => {results_dir} (re-rank with --query {results_dir})")
+    details = {"symbol": symbol, "timeframe": timeframe, "asset_type": asset_type, "combos": done, "total": total,
+               "dedup": dict(stats), "leaderboard": leaderboard_rows(board, "balance")}
+    if monte_carlo and details["leaderboard"]:
+        mc_start = time.time()
+        robust = robustness(df, details["leaderboard"], monte_carlo, mc_method, seed, mc_rank, max_lookahead,
+                            positions)
+        print(f"\nMonte Carlo ({monte_carlo} {mc_method} runs per combo, {time.time() - mc_start:.2f}s):")
+        for row in robust:
+            print(f"  #{row['idx']} ${row['balance']:.2f} -> p5 ${row['balance_p5']:.2f} p50 ${row['balance_p50']:.2f} "
+                  f"p95 ${row['balance_p95']:.2f}, drawdown p50 ${row['drawdown_p50']:.2f} "
+                  f"p95 ${row['drawdown_p95']:.2f}")
+        details["robustness"] = robust
+        if mc_rank is not None:
+            top = robust[0]
+            best = strategy_entry(tuple(top[name] for name in COMBO_PARAMS), top, symbol)
+            best["robust_balance"] = top[f"balance_p{mc_rank:g}"]
+            best_idx = top["idx"]
+            print(f"Ranked by p{mc_rank:g} balance: #{top['idx']} (${best['robust_balance']:.2f})")
+    if surface and done:
+        rows = plateau_rows(surface, plateau, plateau_radius, top_k)
+        print(f"\nTop {len(rows)} by neighbourhood {plateau} balance (radius {plateau_radius}):")
+        for row in rows:
+            print(f"  ${row['plateau']:.2f} (own ${row['balance']:.2f}) "
+                  f"{dict((name, row[name]) for name in COMBO_PARAMS)}")
+        details["plateau"] = rows
+        combo = tuple(rows[0][name] for name in COMBO_PARAMS)
+        res = score_combos(ohlc_arrays(df), [combo], max_lookahead, backend=backend, positions=positions,
+                           metrics=metrics)[0]
+        best = strategy_entry(combo, res, symbol)
+        best["plateau_balance"] = rows[0]["plateau"]
+    if ledger and details["leaderboard"]:
+        rows = details["leaderboard"]
+        trades = trade_ledger(df, [tuple(row[name] for name in COMBO_PARAMS) for row in rows], max_lookahead,
+                              positions)
+        save_ledger(ledger, trades, rows)
+        print(f"Saved {len(trades['pnl'])} trades of the top {len(rows)} combos => {ledger}")
+    if shard and best_idx is not None:
+        # grid position and shard, for --merge
+        best.update(idx=best_idx, shard=f"{shard[0]}/{shard[1]}")
+    if report is not None:
+        report.update(details)
+    if result_key:
+        disk_save("result", result_key, {"best": best, "details": details})
+
+    if timeframe != source_timeframe:
+        best["timeframe"] = timeframe
+    if out:
+        save_strategy(best, out)
+    return best
+
+def tagged_outputs(options, tag):
+    # per-timeframe / per-symbol copies of the file options, so runs sharing
+    # one options dict do not overwrite each other's checkpoint, state, ledger
+    # or result store
+    options = dict(options)
+    if options.get("checkpoint"):
+        options["checkpoint"] = f"{options['checkpoint']}.{tag}"
+    for name in ("incremental", "ledger"):
+        if options.get(name):
+            root, ext = os.path.splitext(options[name])
+            options[name] = f"{root}.{tag}{ext}"
+    if options.get("results_dir"):
+        options["results_dir"] = os.path.join(options["results_dir"], tag)
+    return options
+
+def main_timeframes(path, report=None, **options):
+    # timeframe as the outermost grid dimension: one search per timeframe on
+    # bars resampled from the same file; the highest balance wins, the
+    # earlier timeframe on ties. Checkpoints and result stores get one file /
+    # subdirectory per timeframe.
+    timeframes, out = options.pop("timeframes"), options.pop("out", "strategy.json")
+    best, runs = None, {}
+    for tf in timeframes:
+        print(f"\n=== Timeframe {tf} ===")
+        runs[tf] = {}
+        res = dict(main(path, out=None, report=runs[tf], timeframe=tf, **tagged_outputs(options, tf)), timeframe=tf)
+        if best is None or res["balance"] > best["balance"]:
+            best = res
+    print("\nBest per timeframe:")
+    for tf in timeframes:
+        row = runs[tf]["leaderboard"][0] if runs[tf].get("leaderboard") else None
+        print(f"  {tf}: " + (f"${row['balance']:.2f} winrate={row['winrate']:.2f}% trades={row['trades']}"
+                             if row else "no result"))
+    source = load_mt5_json(path)[1]
+    if best["timeframe"] != source:
+        # balances are not comparable across timeframes (more bars, more
+        # trades), and the live trader has to run on the winner's bars
+        print(f"⚠️ best timeframe {best['timeframe']} differs from the file's {source}: Livetrade must trade "
+              f"{best['timeframe']} candles (it follows the saved \"timeframe\"); pass --timeframes {source} "
+              f"to keep the live timeframe")
+    if report is not None:
+        report.update(symbol=best.get("symbol"), timeframe=best["timeframe"], timeframes=runs)
+    if out:
+        save_strategy(best, out)
+    return best
+
+# main's keyword options in signature order: the one list the CLI, --trigger,
+# --batch, the service and the run fingerprints are built from
+RUN_OPTIONS = tuple(name for name in inspect.signature(main).parameters
+                    if name not in ("path", "report", "timeframe"))
+# options that change how or where a run executes, not what it finds
+RUN_ONLY_OPTIONS = ("workers", "backend", "out", "checkpoint", "checkpoint_every")
+# options naming files or directories (made absolute for --trigger)
+PATH_OPTIONS = ("grid", "incremental", "out", "results_dir", "checkpoint", "ledger")
+# command-line flags whose name differs from the option's
+OPTION_FLAGS = {"max_evals": "--evals", "max_seconds": "--seconds",
+                "top_k": "--top", "results_dir": "--results"}
+
+def option_flag(name):
+    return OPTION_FLAGS.get(name, "--" + name.replace("_", "-"))
+
+def ignored_options(options, supported):
+    # options set away from main's defaults that a mode does not use (None
+    # counts as unset: the CLI passes it for "let main decide")
+    defaults = inspect.signature(main).parameters
+    return [name for name in RUN_OPTIONS if name not in supported
+            and options.get(name) is not None and options[name] != defaults[name].default]
+
+# -----------------------------
+# Multi-symbol batch
+# -----------------------------
+# One warm process pool optimizes every symbol file: pandas/numpy are
+# imported once per worker instead of once per symbol, and symbols run
+# concurrently. Each result goes to <out_dir>/<SYMBOL>-stretegy.json (the
+# layout auto.sh used) through a temp file + rename, so nothing ever writes
+# the shared strategy.json and readers never see a half-written file.
+def batch_output(out_dir, symbol):
+    return os.path.join(out_dir, f"{symbol}-stretegy.json")
+
+def write_json_atomic(path, payload):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp, path)
+
+def _batch_job(job):
+    path, out_dir, options = job
+    log = io.StringIO()
+    start = time.time()
+    try:
+        with contextlib.redirect_stdout(log):
+            best = main(path, **dict(options, out=None))
+    except Exception as e:
+        return path, None, None, f"{type(e).__name__}: {e}", log.getvalue()
+    symbol = best.get("symbol") or os.path.splitext(os.path.basename(path))[0]
+    out = batch_output(out_dir, symbol)
+    write_json_atomic(out, best)
+    return path, best, out, time.time() - start, log.getvalue()
+
+def run_batch(paths, out_dir="result", jobs=None, verbose=False, **options):
+    # options are passed to main() for every symbol; each symbol is scored
+    # serially inside its job, the parallelism is across symbols
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(paths)))
+    options = dict(options, workers=1)
+    warm_backend(pick_backend(options.get("backend", "auto")))
+    print(f"Batch: {len(paths)} symbols on {jobs} processes => {out_dir}/<SYMBOL>-stretegy.json")
+    start = time.time()
+    failed = []
+    work = [(path, out_dir, tagged_outputs(options, os.path.splitext(os.path.basename(path))[0])) for path in paths]
+    with mp.Pool(jobs) if jobs > 1 else contextlib.nullcontext() as pool:
+        results = pool.imap_unordered(_batch_job, work) if pool else map(_batch_job, work)
+        for path, best, out, info, log in results:
+            if verbose:
+                print(log, end="")
+            if best is None:
+                failed.append(path)
+                print(f"❌ {path}: {info}")
+                continue
+            print(f"✅ {best['symbol']}: balance=${best['balance']:.2f} winrate={best['winrate']:.2f}% "
+                  f"trades={best['trades']} ({info:.1f}s) => {out}")
+    print(f"Batch finished in {time.time() - start:.1f}s ({len(paths) - len(failed)}/{len(paths)} symbols)")
+    return not failed
+
+# -----------------------------
+# Optimizer service
+# -----------------------------
+# optimize() is the importable API: it runs main() quietly and returns a
+# dict instead of printing. serve() keeps one warm process behind an HTTP
+# endpoint on a Unix socket, so autoupdate.sh triggers a run with curl
+# instead of paying interpreter start-up, pandas import and .pyc load every
+# cycle; parsed candle files, indicator rows and outcome tables stay cached
+# in memory between runs. Requests run one at a time.
+#   POST /optimize  {"path": "XAUUSD.json", "out": "strategy.json", ...main options}
+#   GET  /status    POST /shutdown
+def optimize(path, verbose=False, **options):
+    # options: any of RUN_OPTIONS
+    unknown = set(options) - set(RUN_OPTIONS)
+    if unknown:
+        raise ValueError(f"unknown options: {sorted(unknown)}")
+    if isinstance(options.get("shard"), str):
+        options["shard"] = parse_shard(options["shard"])
+    options["positions"] = parse_positions(options.get("positions"))
+    if isinstance(options.get("timeframes"), str):
+        options["timeframes"] = parse_timeframes(options["timeframes"])
+    report = {}
+    start = time.time()
+    with contextlib.redirect_stdout(sys.stdout if verbose else io.StringIO()):
+        best = main(path, report=report, **options)
+    return dict(report, ok=True, path=path, best=best, out=options.get("out", "strategy.json"),
+                seconds=round(time.time() - start, 4))
+
+def _service_handler(status):
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def reply(self, code, payload):
+            body = json.dumps(payload, default=str).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != "/status":
+                return self.reply(404, {"ok": False, "error": f"unknown endpoint {self.path}"})
+            self.reply(200, {"ok": True, "uptime": round(time.time() - status["started"], 1),
+                             "runs": status["runs"], "errors": status["errors"], "last_run": status["last_run"],
+                             "cached_datasets": len(_INDICATOR_CACHE), "cached_files": len(_DATA_CACHE)})
+
+        def do_POST(self):
+            if self.path == "/shutdown":
+                self.reply(200, {"ok": True})
+                status["stop"] = True
+                return
+            if self.path != "/optimize":
+                return self.reply(404, {"ok": False, "error": f"unknown endpoint {self.path}"})
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                result = optimize(request.pop("path"), **request)
+            except (KeyError, ValueError, TypeError) as e:
+                return self.reply(400, {"ok": False, "error": f"bad request: {e}"})
+            except Exception as e:
+                status["errors"] += 1
+                return self.reply(500, {"ok": False, "error": f"{type(e).__name__}: {e}"})
+            status["runs"] += 1
+            status["last_run"] = {"path": result["path"], "seconds": result["seconds"]}
+            print(f"{datetime.now()}: optimized {result['path']} in {result['seconds']}s "
+                  f"balance=${result['best']['balance']:.2f}")
+            self.reply(200, result)
+
+        def log_message(self, *args):
+            pass  # one line per run is printed above
+    return Handler
+
+def serve(socket_path):
+    import socketserver
+    if os.path.exists(socket_path):
+        os.remove(socket_path)  # stale socket from a previous process
+    status = {"started": time.time(), "runs": 0, "errors": 0, "last_run": None, "stop": False}
+    warm_backend(pick_backend("auto"))
+    server = socketserver.UnixStreamServer(socket_path, _service_handler(status))
+    print(f"Optimizer listening on {socket_path} (POST /optimize, GET /status, POST /shutdown)")
+    try:
+        while not status["stop"]:
+            server.handle_request()
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+def trigger(socket_path, payload, endpoint="/optimize"):
+    # client side of serve(): returns the decoded JSON reply
+    import http.client
+    import socket
+
+    class UnixConnection(http.client.HTTPConnection):
+        def connect(self):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(socket_path)
+
+    conn = UnixConnection("localhost")
+    try:
+        if payload is None:
+            conn.request("GET", endpoint)
+        else:
+            conn.request("POST", endpoint, json.dumps(payload), {"Content-Type": "application/json"})
+        return json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+
+# -----------------------------
+# Backend parity check
+# -----------------------------
+def check_backends(paths, max_lookahead=300, grid=None):
+    # every backend must give identical wins/losses/balance on every combo of
+    # the grid spec (path or dict, default DEFAULT_GRID)
+    spec = load_grid_spec(grid) if isinstance(grid, str) or grid is None else grid
+    ok = True
+    for path in paths:
+        symbol, _, df = load_mt5_json(path)
+        data = ohlc_arrays(df)
+        ranges = grid_ranges(detect_asset_type(symbol, spec), spec)
+        all_combos = [combo for _, combo in iter_grid(ranges, spec.get("constraints", []))]
+        scores = {name: [(r["wins"], r["losses"], r["balance"])
+                         for r in score_combos(data, all_combos, max_lookahead, backend=name)]
+                  for name in BACKENDS}
+        for name, rows in scores.items():
+            diff = sum(a != b for a, b in zip(rows, scores["numpy"]))
+            if name != "numpy":
+                print(f"{symbol}: numpy vs {name}: {len(rows) - diff}/{len(rows)} combos identical")
+            ok = ok and diff == 0
+    if numba is None:
+        print("numba is not installed; only the uncompiled kernel was compared")
+    return ok
+
 # -----------------------------
 # CLI
 # -----------------------------
+def parse_lookahead(value):
+    if value.lower() in ('none', 'null', '0'):
+        return None
+    return int(value)
+
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Usage: python bruteforce.py path/to/SYMBOL.json [max_lookahead]")
-        sys.exit(1)
-    path = sys.argv[1]
-    if len(sys.argv) > 2 and sys.argv[2].lower() in ('none', 'null', '0'):
-        max_look = None
-    else:
-        max_look = int(sys.argv[2]) if len(sys.argv) > 2 else 300
-    main(path, max_look)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Bruteforce EMA/RSI strategy search over an MT5 JSON candle file")
+    parser.add_argument("path", nargs="?", help="path/to/SYMBOL.json")
+    parser.add_argument("max_lookahead", nargs="?", type=parse_lookahead, default=300,
+                        help="bars to wait for SL/TP (none/0 = until the end of the data)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes for the grid search (batch: symbols in parallel, default all cores)")
+    parser.add_argument("--backend", default="auto", choices=["auto"] + sorted(BACKENDS),
+                        help="trade simulation backend (auto = numpy for grids, numba for single combos when installed)")
+    parser.add_argument("--search", default="grid", choices=["grid", "halving", "random", "bayes"],
+                        help="grid = every combo on the full history; halving = successive halving; "
+                             "random/bayes = budgeted sampling of wider ranges")
+    parser.add_argument("--grid", help="grid spec JSON (default: built-in ranges)")
+    parser.add_argument("--shard", type=parse_shard, help="k/N: only score the k-th of N interleaved shards")
+    parser.add_argument("--merge", nargs="+", metavar="STRATEGY",
+                        help="pick the best of several --shard runs' strategy files into --out and exit")
+    parser.add_argument("--out", default="strategy.json", help="where to save the best strategy")
+    parser.add_argument("--incremental", metavar="STATE",
+                        help="keep per-combo state in this file and only process candles added since the last run")
+    parser.add_argument("--walk-forward", type=parse_walk_forward, metavar="TRAIN:TEST[:STEP]",
+                        help="re-fit on every TRAIN-bar window, score the next TEST bars out of sample "
+                             "(report in walkforward.json)")
+    parser.add_argument("--top", dest="top_k", type=int, default=10, help="leaderboard size per metric (and --query rows)")
+    parser.add_argument("--results", dest="results_dir", metavar="DIR", help="stream every combo's result to a columnar store in DIR")
+    parser.add_argument("--query", metavar="DIR", help="re-rank a --results store and exit")
+    parser.add_argument("--rank-by", default="balance", help="query: column to rank by")
+    parser.add_argument("--where", action="append", default=[], help="query: filter such as 'trades >= 20'")
+    parser.add_argument("--ascending", action="store_true", help="query: lowest first")
+    parser.add_argument("--checkpoint", metavar="FILE",
+                        help="grid/halving: save progress to FILE periodically and resume from it on restart")
+    parser.add_argument("--checkpoint-every", type=float, default=30.0, help="seconds between checkpoints")
+    parser.add_argument("--serve", metavar="SOCKET", help="run the optimizer service on this Unix socket")
+    parser.add_argument("--trigger", metavar="SOCKET",
+                        help="ask a running --serve process to optimize path (prints its JSON reply)")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="on-disk cache of results, indicator rows and outcome tables keyed by content")
+    parser.add_argument("--cache-mb", type=float, default=256, help="evict the oldest cache files past this size")
+    parser.add_argument("--to-store", metavar="DIR",
+                        help="append path (and any --batch files) to a memory-mapped OHLC store and exit; "
+                             "pass DIR as path to optimize over it out of core")
+    parser.add_argument("--validate", metavar="STRATEGY",
+                        help="re-score a saved strategy JSON on path, the bars split into --workers time shards")
+    parser.add_argument("--float32", action="store_true", help="to-store: keep prices as float32")
+    parser.add_argument("--positions", type=parse_positions, metavar="N|side",
+                        help="cap concurrent trades at N (or one BUY and one SELL); default: every signal trades")
+    parser.add_argument("--timeframes", type=parse_timeframes, metavar="TF[,TF...]",
+                        help="search each timeframe (e.g. M1,M5,M15,H1) built from path's bars; "
+                             "also settable as \"timeframes\" in the grid spec")
+    parser.add_argument("--monte-carlo", type=int, default=0, metavar="N",
+                        help="resample the top combos' trades N times and report percentile balance/drawdown")
+    parser.add_argument("--mc-method", default="bootstrap", choices=["bootstrap", "permute"],
+                        help="monte-carlo: draw trades with replacement, or shuffle their order")
+    parser.add_argument("--mc-rank", type=float, metavar="PCT",
+                        help="monte-carlo: pick the best by this percentile balance (e.g. 5) instead of raw balance")
+    parser.add_argument("--metrics", action="store_true",
+                        help="also compute max drawdown, profit factor and expectancy for every combo")
+    parser.add_argument("--ledger", metavar="FILE",
+                        help="write the top combos' trade ledger (entry, exit, direction, pnl) to FILE (.npz)")
+    parser.add_argument("--plateau", choices=PLATEAU_FILTERS,
+                        help="grid: pick the combo whose neighbourhood (mean or worst) balance is highest")
+    parser.add_argument("--plateau-radius", type=int, default=1, help="plateau: grid steps along each axis")
+    parser.add_argument("--eta", type=int, default=3, help="halving: keep 1/eta per rung, grow the slice eta times")
+    parser.add_argument("--evals", dest="max_evals", type=int, default=500, help="random/bayes: evaluation budget")
+    parser.add_argument("--seconds", dest="max_seconds", type=float, default=None, help="random/bayes: wall-clock budget")
+    parser.add_argument("--seed", type=int, default=0, help="random/bayes: RNG seed")
+    parser.add_argument("--batch", nargs="*", metavar="JSON",
+                        help="optimize these files (default data/*.json) concurrently, --workers processes, "
+                             "results in --out-dir")
+    parser.add_argument("--out-dir", default="result", help="batch: directory for <SYMBOL>-stretegy.json")
+    parser.add_argument("--verbose", action="store_true", help="batch: print each symbol's full log")
+    parser.add_argument("--check-backends", nargs="*", metavar="JSON",
+                        help="compare all backends on these files (default data/*.json) and exit")
+    args = parser.parse_args()
+    options = {name: getattr(args, name) for name in RUN_OPTIONS}
+    options["workers"] = args.workers or 1
+    set_disk_cache(args.cache, args.cache_mb)
+    if args.check_backends is not None:
+        import glob
+        paths = args.check_backends or ([args.path] if args.path else sorted(glob.glob("data/*.json")))
+        sys.exit(0 if check_backends(paths, args.max_lookahead, args.grid) else 1)
+    if args.serve:
+        serve(args.serve)
+        sys.exit(0)
+    if args.query:
+        for row in query_results(args.query, args.rank_by, args.top_k, args.where, args.ascending):
+            print(row)
+        sys.exit(0)
+    if args.to_store:
+        for src_path in ([args.path] if args.path else []) + (args.batch or []):
+            symbol, timeframe, df = load_mt5_json(src_path)
+            added = store_add_candles(args.to_store, symbol, timeframe, df, "float32" if args.float32 else "float64")
+            print(f"{src_path}: appended {added} of {len(df)} candles to {args.to_store}")
+        sys.exit(0)
+    if args.batch is not None:
+        import glob
+        paths = args.batch or ([args.path] if args.path else sorted(glob.glob("data/*.json")))
+        sys.exit(0 if run_batch(paths, args.out_dir, args.workers, args.verbose, **options) else 1)
+    if args.merge:
+        merge_shards(args.merge, args.out)
+        sys.exit(0)
+    if args.path is None:
+        parser.error("path is required")
+    if args.trigger:
+        request = {name: os.path.abspath(value) if name in PATH_OPTIONS and value else value
+                   for name, value in options.items()}
+        request["path"] = os.path.abspath(args.path)
+        reply = trigger(args.trigger, request)
+        print(json.dumps(reply, indent=2, default=str))
+        sys.exit(0 if reply.get("ok") else 1)
+    if args.validate:
+        main_validate(args.path, args.validate, args.max_lookahead, args.workers or 1, args.positions)
+        sys.exit(0)
+    if args.walk_forward:
+        main_walk_forward(args.path, args.walk_forward, args.max_lookahead, args.grid)
+        sys.exit(0)
+    main(args.path, **options)
@@ -126,9 +126,10 @@ while True:
         # ----------------------------
         sl_pct = strategy.get("sl_pct", 0.005)
         tp_pct = strategy.get("tp_pct", 0.01)
+        timeframe = strategy.get("timeframe", "M1")  # bars the strategy was optimized on
         lot = 0.005 if any(x in symbol.upper() for x in ["BTC", "ETH", "XAU"]) else 0.05
 
-        url = f"{SERVER_URL}/candles?symbol={symbol}&timeframe=M1&count=200"
+        url = f"{SERVER_URL}/candles?symbol={symbol}&timeframe={timeframe}&count=200"
         resp = requests.get(url, timeout=10)
         candles = resp.json().get("candles", [])
         if not candles:
@@ -99,12 +99,13 @@ while True:
 
         sl_pct = strategy.get("sl_pct", 0.005)
         tp_pct = strategy.get("tp_pct", 0.01)
+        timeframe = strategy.get("timeframe", "M1")  # bars the strategy was optimized on
         can_trade = strategy.get("winrate", 0) >= 50
 
         print(f"📌 Strategy reloaded | Symbol={symbol} | lot={lot} | can_trade={can_trade}")
 
         # --- Fetch candles ---
-        resp = requests.get(f"{SERVER_URL}/candles?symbol={symbol}&timeframe=M1&count=200", timeout=10)
+        resp = requests.get(f"{SERVER_URL}/candles?symbol={symbol}&timeframe={timeframe}&count=200", timeout=10)
         candles = resp.json().get("candles", [])
         if not candles:
             print("⚠️ No candles returned")
@@ -1,6 +1,14 @@
 #!/bin/sh
 # autoupdate.sh - runs in an infinite loop to refresh strategy every hour
 
+# one warm optimizer process; every cycle triggers a run over its socket
+SOCK="$PWD/optimizer.sock"
+# parameter grid searched every cycle (shipped next to this script)
+GRID="$PWD/grid.json"
+python3 finelbrutforce.pyc --serve "$SOCK" --cache .bfcache &
+SERVICE_PID=$!
+sleep 5
+
 while true
 do
     ASSET=$(basename "$PWD")
@@ -12,7 +20,22 @@ do
     # run compiled bruteforce to generate strategy.json
     # make sure finelbrutforce.pyc exists (compiled)
     echo "$(date): Running finelbrutforce..."
-    python3 finelbrutforce.pyc "$ASSET.json" || python3 finelbrutforce.pyc "$ASSET.json"
+    # only candles added since the previous cycle are processed (state in $ASSET.state.npz)
+    # --max-time: a hung service must not stall the loop
+    if ! curl -s --max-time 900 --unix-socket "$SOCK" -X POST http://localhost/optimize \
+        -d "{\"path\": \"$PWD/$ASSET.json\", \"incremental\": \"$PWD/$ASSET.state.npz\", \"out\": \"$PWD/strategy.json\", \"grid\": \"$GRID\"}" \
+        | jq -e '.ok' > /dev/null; then
+        echo "$(date): optimizer service failed, running finelbrutforce directly"
+        python3 finelbrutforce.pyc "$ASSET.json" --grid "$GRID" --incremental "$ASSET.state.npz" \
+            || python3 finelbrutforce.pyc "$ASSET.json" --grid "$GRID" --cache .bfcache
+        # restart the service unless it still answers; a killed service
+        # (SIGKILL, OOM) leaves its socket file behind, so probe it
+        if ! curl -s --max-time 5 --unix-socket "$SOCK" http://localhost/status > /dev/null; then
+            kill "$SERVICE_PID" 2> /dev/null
+            python3 finelbrutforce.pyc --serve "$SOCK" --cache .bfcache &
+            SERVICE_PID=$!
+        fi
+    fi
 
     # move generated strategy into LIVE.json for livetrader
     if [ -f strategy.json ]; then
@@ -3,21 +3,24 @@
 # List of assets
 ASSETS=("EURUSD" "GBPUSD" "AUDUSD" "USDJPY" "USDCHF" "XAUUSD" "BTCUSD" "ETHUSD" )
 
-# Loop through each asset
+# Fetch candles for every asset first
 for ASSET in "${ASSETS[@]}"; do
     echo "🔹 Fetching candles for $ASSET ..."
     curl -s -X GET "http://44.242.196.239:8000/candles?symbol=$ASSET&timeframe=M1&count=300" \
         -o "data/$ASSET.json"
+done
 
-    echo "⚡ Running bruteforce for $ASSET ..."
-    python3.9 finelbrutforce.py "data/$ASSET.json" 
+# One warm process optimizes all assets in parallel => result/$ASSET-stretegy.json
+echo "⚡ Running bruteforce for ${ASSETS[*]} ..."
+FILES=()
+for ASSET in "${ASSETS[@]}"; do FILES+=("data/$ASSET.json"); done
+python3.9 finelbrutforce.py --batch "${FILES[@]}" --grid grid.json --out-dir result --cache .bfcache
 
+for ASSET in "${ASSETS[@]}"; do
     echo "✅ Completed $ASSET"
     echo "------------------------------------"
-    mv strategy.json result/$ASSET-stretegy.json
     cat result/$ASSET-stretegy.json|jq -r '.winrate'
 done
 
-
 # fetch the candels and create stgy json
 # chose the best from all jsons based on 
\ No newline at end of file
@@ -14,6 +14,7 @@ with open("LIVE.json") as f:
 symbol = strategy.get("symbol")
 sl_pct = strategy.get("sl_pct", 0.005)   # stop loss %
 tp_pct = strategy.get("tp_pct", 0.01)   # take profit %
+timeframe = strategy.get("timeframe", "M1")   # bars the strategy was optimized on
 if not symbol:
     print("❌ No symbol found in strategy.json. Add 'symbol': 'XAUUSD' etc.")
     exit(1)
@@ -66,7 +67,7 @@ def close_trade(ticket):
 while True:
     try:
         # Get candles
-        url = f"{SERVER_URL}/candles?symbol={symbol}&timeframe=M1&count=200"
+        url = f"{SERVER_URL}/candles?symbol={symbol}&timeframe={timeframe}&count=200"
         resp = requests.get(url, timeout=10)
         candles = resp.json().get("candles", [])
         if not candles:
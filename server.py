@@ -54,7 +54,9 @@ def get_candles(symbol: str, timeframe: str = "M1", count: int = 600):
         "M1": mt5.TIMEFRAME_M1,
         "M5": mt5.TIMEFRAME_M5,
         "M15": mt5.TIMEFRAME_M15,
+        "M30": mt5.TIMEFRAME_M30,
         "H1": mt5.TIMEFRAME_H1,
+        "H4": mt5.TIMEFRAME_H4,
         "D1": mt5.TIMEFRAME_D1,
     }
     if timeframe not in tf_map:
@@ -0,0 +1,67 @@
+import os
+import sys
+from glob import glob
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import finelbrutforce as bf  # noqa: E402
+
+DATA = sorted(glob(os.path.join(ROOT, "data", "*.json")))
+
+SMALL_GRID = {
+    "params": {"ema_fast": [3, 9], "ema_slow": [9, 30], "rsi_period": [5, 14],
+               "rsi_buy": [35, 50], "rsi_sell": [50, 65]},
+    "asset_types": {"METAL": ["XAU"], "CRYPTO": ["BTC", "ETH"]},
+    "overrides": {
+        "FX": {"sl": [0.0003, 0.001], "tp": [0.0005, 0.003]},
+        "METAL": {"sl": [0.001, 0.004], "tp": [0.002, 0.008]},
+        "CRYPTO": {"sl": [0.003], "tp": [0.004, 0.02]},
+    },
+    "constraints": ["ema_fast < ema_slow"],
+}
+
+
+def grid_combos(path, spec):
+    symbol, _, df = bf.load_mt5_json(path)
+    ranges = bf.grid_ranges(bf.detect_asset_type(symbol, spec), spec)
+    return df, [combo for _, combo in bf.iter_grid(ranges, spec.get("constraints", []))]
+
+
+def test_data_files_present():
+    assert DATA, "no data/*.json candle files"
+
+
+@pytest.mark.parametrize("max_lookahead", [300, None])
+def test_check_backends(max_lookahead):
+    assert bf.check_backends(DATA, max_lookahead)
+
+
+def test_check_backends_grid_spec():
+    assert bf.check_backends(DATA, 20, SMALL_GRID)
+
+
+# batched scoring (shared outcome tables, bitsets, dedup) against the
+# baseline: one run_strategy per combo through the uncompiled bar loop
+@pytest.mark.parametrize("path", DATA, ids=[os.path.basename(p) for p in DATA])
+@pytest.mark.parametrize("spec", [bf.DEFAULT_GRID, SMALL_GRID], ids=["default", "small"])
+@pytest.mark.parametrize("max_lookahead", [300, None, 5])
+def test_score_combos_matches_per_combo_simulation(path, spec, max_lookahead):
+    df, combos = grid_combos(path, spec)
+    data = bf.ohlc_arrays(df)
+    batched = bf.score_combos(data, combos, max_lookahead, backend="numpy", dedup=bf.new_dedup())
+    for combo, res in zip(combos, batched):
+        ref = bf.run_strategy(df, *combo, max_lookahead=max_lookahead, backend="python")
+        assert (res["wins"], res["losses"], res["balance"]) == (ref["wins"], ref["losses"], ref["balance"]), combo
+
+
+
+def test_auto_backend():
+    # grids always score through numpy; a single combo takes numba when installed
+    assert bf.pick_backend("auto") == "numpy"
+    assert bf.pick_backend("auto", per_combo=True) == ("numba" if "numba" in bf.BACKENDS else "numpy")
+    df, combos = grid_combos(DATA[0], SMALL_GRID)
+    for combo in combos[:20]:
+        assert bf.run_strategy(df, *combo) == bf.run_strategy(df, *combo, backend="python"), combo
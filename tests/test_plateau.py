@@ -0,0 +1,58 @@
+import os
+import sys
+from glob import glob
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import finelbrutforce as bf  # noqa: E402
+
+DATA = sorted(glob(os.path.join(ROOT, "data", "*.json")))
+
+
+def synthetic(n=6000, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 2000 * np.exp(np.cumsum(rng.normal(0, 0.0007, n)))
+    openp = np.concatenate([[close[0]], close[:-1]])
+    high = np.maximum(openp, close) * (1 + np.abs(rng.normal(0, 0.0004, n)))
+    low = np.minimum(openp, close) * (1 - np.abs(rng.normal(0, 0.0004, n)))
+    return pd.DataFrame({"time": pd.date_range("2024-01-01", periods=n, freq="min"),
+                         "open": openp, "high": high, "low": low, "close": close})
+
+
+def grid_surface(df, asset_type):
+    ranges = bf.grid_ranges(asset_type)
+    combos = [combo for _, combo in bf.iter_grid(ranges, bf.DEFAULT_GRID["constraints"])]
+    surface = bf.new_surface(ranges)
+    for combo, res in zip(combos, bf.score_combos(bf.ohlc_arrays(df), combos)):
+        bf.surface_add(surface, combo, res["balance"])
+    return surface
+
+
+def surfaces():
+    for path in DATA:
+        symbol, _, df = bf.load_mt5_json(path)
+        yield os.path.basename(path), grid_surface(df, bf.detect_asset_type(symbol))
+    yield "synthetic", grid_surface(synthetic(), "CRYPTO")
+
+
+@pytest.mark.parametrize("method", bf.PLATEAU_FILTERS)
+def test_pick_not_worse_than_tied_cells(method):
+    for name, surface in surfaces():
+        rows = bf.plateau_rows(surface, method, top=10 ** 6)
+        tied = [row["balance"] for row in rows if row["plateau"] == rows[0]["plateau"]]
+        assert rows[0]["balance"] == max(tied), name
+
+
+def test_short_axes_left_out():
+    # with two values per axis a radius-1 window covers the whole axis; such
+    # axes must not smooth, so the filter leaves the surface unchanged
+    tensor = np.arange(8, dtype=float).reshape(2, 2, 2)
+    assert np.array_equal(bf.plateau_scores(tensor, "mean"), tensor)
+    assert np.array_equal(bf.plateau_scores(tensor, "min"), tensor)
+    tensor = np.array([[0.0, 9.0, 0.0], [1.0, 2.0, 3.0]])
+    assert np.array_equal(bf.plateau_scores(tensor, "mean"), [[4.5, 3.0, 4.5], [1.5, 2.0, 2.5]])